@@ -0,0 +1,110 @@
+"""
+ElevenLabs text-to-speech client for the zoo voice assistant.
+
+Wraps the ElevenLabs HTTP API with httpx: `_generate_audio` fetches a
+complete MP3 for short replies, `_stream_audio` yields MP3 chunks as the
+API produces them for low time-to-first-audio.
+"""
+
+import logging
+import os
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+ELEVENLABS_BASE_URL = "https://api.elevenlabs.io/v1"
+DEFAULT_VOICE_ID = "EXAVITQu4vr4xnSDxMaL"
+DEFAULT_MODEL_ID = "eleven_turbo_v2_5"
+
+
+class ElevenLabsTTS:
+    """Async ElevenLabs TTS with batch and streaming modes."""
+
+    def __init__(self, api_key=None, voice_id=None):
+        self.api_key = api_key or os.environ.get("ELEVENLABS_API_KEY")
+        self.voice_id = voice_id or os.environ.get(
+            "ELEVENLABS_VOICE_ID", DEFAULT_VOICE_ID)
+        self.model_id = os.environ.get("ELEVENLABS_MODEL_ID", DEFAULT_MODEL_ID)
+        self.available = bool(self.api_key and HTTPX_AVAILABLE)
+        self._client = None
+        if not self.available:
+            logger.warning("⚠️ ElevenLabs TTS not configured (no API key or httpx)")
+
+    def _get_client(self):
+        """Shared AsyncClient so TLS/connection setup is paid once."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=30.0)
+        return self._client
+
+    def _headers(self):
+        return {
+            "xi-api-key": self.api_key,
+            "Content-Type": "application/json",
+            # MP3 is already compressed: letting httpx negotiate gzip just
+            # buys a no-op decompress pass over the audio bytes.
+            "Accept-Encoding": "identity",
+        }
+
+    def _payload(self, text):
+        return {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": {"stability": 0.5, "similarity_boost": 0.75},
+        }
+
+    async def _generate_audio(self, text):
+        """Fetch the full MP3 for `text`; returns bytes or None."""
+        if not self.available:
+            return None
+        # Lazy %-formatting: under WARNING log level the slice/len aren't
+        # wasted on every TTS call.
+        logger.info("🎙️ ElevenLabs: TTS for %r (%d chars)", text[:80], len(text))
+        try:
+            client = self._get_client()
+            response = await client.post(
+                f"{ELEVENLABS_BASE_URL}/text-to-speech/{self.voice_id}",
+                headers=self._headers(),
+                json=self._payload(text),
+            )
+            response.raise_for_status()
+            audio = response.content
+            logger.info("✅ ElevenLabs: got %d audio bytes", len(audio))
+            return audio
+        except Exception as e:
+            logger.error("❌ ElevenLabs TTS failed: %s", e)
+            return None
+
+    async def _stream_audio(self, text):
+        """Yield MP3 chunks as ElevenLabs produces them."""
+        if not self.available:
+            return
+        logger.info("🎙️ ElevenLabs: streaming TTS for %r (%d chars)",
+                    text[:80], len(text))
+        try:
+            client = self._get_client()
+            async with client.stream(
+                "POST",
+                f"{ELEVENLABS_BASE_URL}/text-to-speech/{self.voice_id}/stream",
+                headers=self._headers(),
+                json=self._payload(text),
+            ) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size=4096):
+                    if chunk:
+                        yield chunk
+        except Exception as e:
+            logger.error("❌ ElevenLabs streaming TTS failed: %s", e)
+
+    async def create_audio_response_async(self, text):
+        """Public batch entry point used by the response pipeline."""
+        return await self._generate_audio(text)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,1428 @@
+"""
+Enhanced RAG pipeline with Azure OpenAI for the zoo voice assistant.
+
+Combines three knowledge sources when answering a visitor question:
+
+1. the local SQLite ``animals`` database (detailed species facts),
+2. the static park knowledge base (``park_knowledge``),
+3. Azure OpenAI chat completions for natural, kid-friendly phrasing.
+
+If the OpenAI call fails the pipeline falls back to a purely local
+template-based answer so the assistant keeps working offline.
+"""
+
+import asyncio
+import functools
+import io
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import textwrap
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+
+try:
+    from openai import (AsyncAzureOpenAI, APIConnectionError, APITimeoutError,
+                        RateLimitError)
+    OPENAI_AVAILABLE = True
+    # Transient failures worth retrying; auth/validation errors are not.
+    _RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError)
+except ImportError:
+    OPENAI_AVAILABLE = False
+    _RETRYABLE_ERRORS = ()
+
+try:
+    from tenacity import (AsyncRetrying, retry_if_exception_type,
+                          stop_after_attempt, wait_random_exponential)
+    TENACITY_AVAILABLE = True
+except ImportError:
+    TENACITY_AVAILABLE = False
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+from park_knowledge import (
+    PARK_INFO,
+    PARK_ANIMAL_INFO,
+    TRANSPORT_PHRASES,
+    find_animal_location,
+    search_animal_detailed_info,
+    get_all_galleries_summary,
+)
+
+logger = logging.getLogger(__name__)
+
+# System prompts are dedented + stripped once at import time: Azure counts
+# tokens on leading whitespace, so shipping the raw triple-quoted indentation
+# on every request would bill ~20-30% extra tokens in the system role.
+SYSTEM_PROMPTS = MappingProxyType({
+    "animal_info": textwrap.dedent("""
+        You are Zoe, the friendly voice guide of the zoo. You talk to
+        visitors (often children) about our animals.
+
+        Style rules:
+        - Answer in 2-3 short, enthusiastic sentences suitable for voice output.
+        - Use the ZOO ANIMAL DATABASE facts when they are provided - never
+          contradict them.
+        - If asked where an animal lives in the park, give the gallery name
+          and zone from the context.
+        - Never invent animals we do not have.
+        """).strip(),
+    "park_info": textwrap.dedent("""
+        You are Zoe, the friendly voice guide of the zoo. You help visitors
+        find their way around the park: rides, shows, opening hours,
+        transport and facilities.
+
+        Style rules:
+        - Answer in 2-3 short sentences suitable for voice output.
+        - Use the PARK INFORMATION context when provided - never contradict it.
+        - For directions, name the zone (Waterfront or Summit) and the nearest
+          landmark.
+        """).strip(),
+    "greeting": textwrap.dedent("""
+        You are Zoe, the friendly voice guide of the zoo. A visitor has just
+        greeted you. Reply with one warm, short sentence and invite them to
+        ask about our animals or the park.
+        """).strip(),
+    "general": textwrap.dedent("""
+        You are Zoe, the friendly voice guide of the zoo. Answer general
+        questions helpfully in 2-3 short sentences suitable for voice
+        output. If the question is unrelated to the zoo, gently steer the
+        visitor back to animals and park activities.
+        """).strip(),
+})
+
+# Local-fallback response templates: one interned format string per
+# branch, filled straight from AnimalRecord attributes, instead of
+# appending f-string fragments to a list and joining them per call.
+_LOC_T = "You can find our {0.common_name} at {0.location_in_park}!"
+_DIET_T = "Our {0.common_name} love to eat {0.diet}! {0.behavior}"
+_BEHAVIOR_T = "{0.common_name}s are fascinating - {0.behavior}"
+_CONSERVATION_T = ("The {0.common_name} is listed as {0.conservation_status}. "
+                   "Visiting the park helps fund our conservation programmes!")
+_GENERAL_T = ("The {0.common_name} ({0.scientific_name}) is amazing! "
+              "{0.characteristics} Fun fact: {0.fun_facts}")
+
+# Invariant prompt fragments, built once instead of per call.
+_SEP = "=" * 60
+_RULES = ("IMPORTANT RULES:\n"
+          "- When they ask about an animal, use the database facts above.\n"
+          "- Keep the answer short enough to speak aloud (2-3 sentences).\n"
+          "- Stay warm and enthusiastic; you are talking to families.")
+
+# Official name -> variations visitors actually say.  Shared read-only across
+# all RAG instances (multi-user chatbot workers each build their own
+# EnhancedRAGWithOpenAI) so the dict/list churn happens once per process.
+_ANIMAL_PATTERNS = MappingProxyType({
+    "Giant Panda": ("giant panda", "panda", "pandas", "an an", "ying ying"),
+    "Red Panda": ("red panda", "red pandas", "firefox", "lesser panda"),
+    "Capybara": ("capybara", "capybaras", "capy", "water pig"),
+    "Two-toed Sloth": ("sloth", "sloths", "two-toed sloth"),
+    "King Penguin": ("king penguin", "penguin", "penguins"),
+    "California Sea Lion": ("sea lion", "sea lions", "sealion"),
+    "Spotted Seal": ("spotted seal", "seal", "seals"),
+    "Arctic Fox": ("arctic fox", "fox", "foxes", "snow fox"),
+})
+
+# Reverse map: every variation (and the official name itself) -> official name.
+_VARIATION_TO_OFFICIAL = MappingProxyType({
+    variation: official
+    for official, variations in _ANIMAL_PATTERNS.items()
+    for variation in (official.lower(), *variations)
+})
+
+# Single compiled alternation over every alias: one C-level scan replaces
+# ~25 interpreted substring tests per message.  Longest-first ordering makes
+# "red panda" win over "panda".
+_ALIAS_RE = re.compile(
+    r"\b(" + "|".join(
+        re.escape(alias)
+        for alias in sorted(_VARIATION_TO_OFFICIAL, key=len, reverse=True))
+    + r")\b",
+    re.IGNORECASE,
+)
+
+# Park-directions animal keywords, compiled once the same way: one DFA scan
+# replaces the 20-iteration `kw in query_lower` loop in
+# get_park_info_context, and longest-first keeps "red panda" ahead of
+# "panda".
+_PARK_ANIMAL_KEYWORDS = (
+    "red panda", "panda", "capybara", "sloth", "penguin", "sea lion",
+    "seal", "fox", "shark", "ray", "jelly", "meerkat", "tortoise",
+    "monkey", "salamander", "owl", "kinkajou", "ibis", "wrasse", "aviary")
+# Single-word keywords match by hashed token intersection (O(tokens) set
+# lookups); only the multi-word phrases still need a scan, so the compiled
+# alternation shrinks to two entries.  The token map carries plural forms
+# pointing at the canonical keyword.
+_PARK_ANIMAL_TOKEN_MAP = MappingProxyType({
+    token: kw
+    for kw in _PARK_ANIMAL_KEYWORDS if " " not in kw
+    for token in (kw, kw + "s")})
+_PARK_ANIMAL_PHRASE_RE = re.compile(
+    r"\b(" + "|".join(
+        re.escape(kw)
+        for kw in sorted(_PARK_ANIMAL_KEYWORDS, key=len, reverse=True)
+        if " " in kw)
+    + r")\b")
+# Token splitter shared by the set-intersection matchers.
+_WORD_RE = re.compile(r"[a-z]+")
+# Sentence boundary for the speech streamer: punctuation only counts
+# when followed by whitespace (or end of text), so decimals like "3.14"
+# don't split mid-number.  Same pattern as the ESP32 streamer's chunker.
+_SENT_RE = re.compile(r"[.!?](?:\s|$)")
+# Gallery-name tokens ("pacific", "pier", ...) for the park-context
+# fingerprint: a query touching none of the category words, no animal and
+# no gallery name cannot produce park context, so it exits early.
+_GALLERY_TOKENS = frozenset(
+    token
+    for info in PARK_ANIMAL_INFO.values()
+    for token in info.name.lower().split())
+
+# Category trigger words for get_park_info_context.  One finditer pass with
+# named groups replaces ~8 independent any()/substring scans of the query;
+# the branch bodies then just test membership in the hit set.
+_PARK_CATEGORIES = MappingProxyType({
+    "ride": ("ride", "rides", "roller coaster", "coaster", "galleon",
+             "hair raiser", "flash", "rapids", "twister", "thrill"),
+    "family": ("family", "kids", "children", "carousel", "merry-go-round",
+               "ferris wheel", "old hong kong", "playground"),
+    "hours": ("hours", "open", "opening", "close", "closing", "time", "when"),
+    "transport": ("mtr", "bus", "travel", "get there", "get here",
+                  "cable car", "ocean express", "transport", "train"),
+    "zone": ("waterfront", "summit", "zone", "zones", "area", "areas"),
+    "conservation": ("conservation", "protect", "save", "research",
+                     "endangered"),
+    "galleries": ("how many", "all galleries", "all animals", "what animals",
+                  "which animals"),
+    "direction": ("where", "find", "how to get", "directions", "location"),
+})
+_PARK_CATEGORY_RE = re.compile("|".join(
+    r"\b(?P<%s>%s)\b" % (
+        name,
+        "|".join(re.escape(p)
+                 for p in sorted(phrases, key=len, reverse=True)))
+    for name, phrases in _PARK_CATEGORIES.items()))
+
+# The full 13-column SELECT, built once instead of re-allocating the
+# triple-quoted literal inside every search branch.  sqlite3's statement
+# cache keys on the exact SQL text, so sharing one string per shape also
+# guarantees the prepared statements are reused.
+_ANIMAL_COLUMNS = ("common_name, scientific_name, category, habitat, diet, "
+                   "lifespan, size, weight, characteristics, behavior, "
+                   "conservation_status, location_in_park, fun_facts")
+_SQL_ANIMAL_EXACT = (f"SELECT {_ANIMAL_COLUMNS} FROM animals "
+                     "WHERE LOWER(common_name) = ? LIMIT 1")
+_SQL_ANIMAL_LIKE = (f"SELECT {_ANIMAL_COLUMNS} FROM animals "
+                    "WHERE LOWER(common_name) LIKE ? LIMIT 1")
+_SQL_ANIMAL_FTS = (f"SELECT {_ANIMAL_COLUMNS} FROM animals WHERE id IN "
+                   "(SELECT rowid FROM animals_fts "
+                   "WHERE animals_fts MATCH ? LIMIT 1)")
+
+
+@functools.lru_cache(maxsize=8)
+def _sql_animal_like_any(n):
+    """OR-combined LIKE over `n` keywords, one statement shape per arity.
+
+    The keyword fallback used to issue one query per matched keyword; a
+    single OR chain lets SQLite resolve every candidate in one execution,
+    and caching per arity keeps the statement text (and therefore the
+    prepared statement) stable.
+    """
+    clause = " OR ".join(["common_name LIKE ? COLLATE NOCASE"] * n)
+    return f"SELECT {_ANIMAL_COLUMNS} FROM animals WHERE {clause} LIMIT 1"
+
+
+class _LocalEmbedder:
+    """Key-only embedder for the semantic cache (quantized MiniLM ONNX).
+
+    Checking the cache with the OpenAI embeddings endpoint costs a network
+    round-trip that can exceed what a hit saves.  An int8-quantized
+    sentence-transformer (e.g. all-MiniLM-L6-v2 exported to ONNX) embeds a
+    short query in a few ms on CPU, so the cache check stays local.
+
+    Both onnxruntime and tokenizers are optional; construction raises if
+    either is missing and callers fall back to the API embedder.
+    """
+
+    def __init__(self, model_path, tokenizer_path):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        self._session = ort.InferenceSession(
+            model_path, providers=["CPUExecutionProvider"])
+        self._tokenizer = Tokenizer.from_file(tokenizer_path)
+
+    def embed(self, text):
+        """Return an L2-normalized float16 vector for `text`."""
+        encoding = self._tokenizer.encode(text)
+        ids = np.asarray([encoding.ids], dtype=np.int64)
+        mask = np.asarray([encoding.attention_mask], dtype=np.int64)
+        outputs = self._session.run(
+            None, {"input_ids": ids, "attention_mask": mask,
+                   "token_type_ids": np.zeros_like(ids)})
+        # Mean-pool token embeddings under the attention mask.
+        hidden = outputs[0][0]
+        weights = mask[0][:, None].astype(np.float32)
+        vec = (hidden * weights).sum(axis=0) / weights.sum()
+        vec = vec / np.linalg.norm(vec)
+        # float16 halves the bandwidth of the cosine-similarity compares.
+        return vec.astype(np.float16)
+
+
+@dataclass(slots=True, frozen=True)
+class AnimalRecord:
+    """One row of the animals table with named, slot-backed fields.
+
+    Replaces the bare 13-tuple the search used to return: consumers read
+    ``record.diet`` instead of unpacking 13 positionals, and frozen+slots
+    keeps instances hashable for the lru_cache'd formatters.
+    """
+
+    common_name: str
+    scientific_name: str
+    category: str
+    habitat: str
+    diet: str
+    lifespan: str
+    size: str
+    weight: str
+    characteristics: str
+    behavior: str
+    conservation_status: str
+    location_in_park: str
+    fun_facts: str
+
+
+def _animal_row_factory(cursor, row):
+    return AnimalRecord(*row)
+
+
+@functools.lru_cache(maxsize=2048)
+def _extract_animal(message_lower):
+    """Cached alias lookup: visitors repeat the same short questions a lot."""
+    match = _ALIAS_RE.search(message_lower)
+    return _VARIATION_TO_OFFICIAL[match.group(1)] if match else None
+
+
+@functools.lru_cache(maxsize=64)
+def _format_animal_row(record):
+    """Render an AnimalRecord into the context block handed to the LLM.
+
+    Rows are immutable for the process lifetime and there are only ~8
+    animals, so the whole template set stays cached after warmup.
+    """
+    return (
+        f"Animal: {record.common_name} ({record.scientific_name})\n"
+        f"Category: {record.category}\n"
+        f"Habitat: {record.habitat}\n"
+        f"Diet: {record.diet}\n"
+        f"Lifespan: {record.lifespan}\n"
+        f"Size: {record.size}, Weight: {record.weight}\n"
+        f"Characteristics: {record.characteristics}\n"
+        f"Behavior: {record.behavior}\n"
+        f"Conservation status: {record.conservation_status}\n"
+        f"Location in park: {record.location_in_park}\n"
+        f"Fun facts: {record.fun_facts}"
+    )
+
+
+class EnhancedRAGWithOpenAI:
+    """RAG pipeline: local animal DB + park knowledge + Azure OpenAI."""
+
+    # Fixed prompt fragments, allocated once instead of per call.
+    _DB_HEADER = "ZOO ANIMAL DATABASE:"
+    _PARK_HEADER = "PARK INFORMATION:"
+    _USER_HEADER = "VISITOR MEMORY:"
+    _HISTORY_HEADER = "RECENT CONVERSATION:"
+
+    def __init__(self, db_path=None, max_concurrent=None):
+        self.db_path = db_path or self._find_database()
+        self._fts_available = False
+        # One long-lived connection per instance: per-query connect() paid
+        # file-open, pager init and statement re-compile for a ~200 µs read.
+        self._conn = None
+        self._db_lock = threading.Lock()
+        if self.db_path:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._conn.executescript(
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA temp_store=MEMORY;"
+                "PRAGMA cache_size=-8000;"
+            )
+            self._ensure_fts_index()
+            # The pipeline only ever reads; query_only makes that a hard
+            # guarantee and lets SQLite skip write-path bookkeeping.
+            self._conn.execute("PRAGMA query_only=1")
+
+        self.animal_patterns = _ANIMAL_PATTERNS
+        self.system_prompts = SYSTEM_PROMPTS
+        # Specialized prompt assembly per query type (None -> generic path).
+        self._prompt_builders = {
+            qt: self._compile_prompt_builder(qt) for qt in SYSTEM_PROMPTS}
+        # One compiled scan + one SQL round-trip for the keyword fallback,
+        # instead of up to 8 sequential LIKE queries (N+1 pattern).
+        self._db_keywords = ("panda", "capybara", "sloth", "penguin", "seal",
+                             "sea lion", "fox", "tortoise")
+        self._keyword_re = re.compile(
+            r"\b(" + "|".join(self._db_keywords) + r")\b")
+        # ~10-20 animals fit comfortably in memory: load them once so the
+        # hot search path is a dict lookup, keeping SQLite as cold fallback.
+        self._animals = {}
+        self._keyword_to_animal = {}
+        if self._conn is not None:
+            self._load_animals_in_memory()
+        # Per-instance memo so cached rows die with their connection.
+        self._search_cached = functools.lru_cache(maxsize=512)(
+            self._animal_search_uncached)
+
+        # Azure OpenAI configuration (environment-driven).
+        self.deployment_name = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o-mini")
+        self.max_tokens = int(os.environ.get("AZURE_OPENAI_MAX_TOKENS", "200"))
+        self.temperature = float(os.environ.get("AZURE_OPENAI_TEMPERATURE", "0.7"))
+
+        # Semantic response cache: canonical key -> (embedding, response).
+        # Kid-facing traffic is heavily skewed onto ~8 animals, so paraphrase
+        # hits are common; a hit skips the multi-second chat completion for
+        # the price of one embedding call.
+        self._sem_cache = OrderedDict()
+        self._sem_cache_max = 1024
+        self._sem_threshold = 0.92
+        # Stacked embedding store for one-matmul similarity search.
+        self._emb_matrix = None
+        self._emb_bucket_ids = None
+        self._emb_keys = []
+        self._emb_count = 0
+        self._bucket_ids = {}
+        # Embeddings computed by a lookup, keyed per cache key so
+        # concurrent queries don't clobber each other's vector; the
+        # matching store consumes them instead of re-embedding.
+        self._pending_embeddings = {}
+        # Keep strong refs to fire-and-forget embed tasks so the loop
+        # doesn't garbage-collect them mid-flight.
+        self._embed_tasks = set()
+        self.embedding_model = os.environ.get(
+            "AZURE_OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+        self._local_embedder = None
+        onnx_path = os.environ.get("RAG_EMBEDDER_ONNX")
+        tokenizer_path = os.environ.get("RAG_EMBEDDER_TOKENIZER")
+        if NUMPY_AVAILABLE and onnx_path and tokenizer_path:
+            try:
+                self._local_embedder = _LocalEmbedder(onnx_path, tokenizer_path)
+                logger.info("✅ Local cache-key embedder loaded")
+            except Exception as e:
+                logger.warning("⚠️ Local embedder unavailable: %s", e)
+
+        self.async_client = None
+        self.openai_available = False
+        self._reprobe_task = None
+        # Cap in-flight completions so a visitor burst cannot blow through
+        # the Azure deployment's rate limit.  Counters feed
+        # concurrency_stats() for health/debug endpoints.
+        self.max_concurrent = max_concurrent or int(
+            os.environ.get("RAG_MAX_CONCURRENT", "32"))
+        self._sem = asyncio.Semaphore(self.max_concurrent)
+        self._pending_requests = 0
+        self._in_flight_requests = 0
+        api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+        endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+        if OPENAI_AVAILABLE and api_key and endpoint:
+            api_version = os.environ.get("AZURE_OPENAI_API_VERSION", "2024-06-01")
+            self.async_client = AsyncAzureOpenAI(
+                api_key=api_key,
+                api_version=api_version,
+                azure_endpoint=endpoint,
+            )
+            # Optimistic availability: a blocking 1-token probe here added a
+            # full LLM round-trip to every cold start. _call_openai_api
+            # already flips the flag off on real failures; keep the probe
+            # opt-in for deployments that want startup health reporting.
+            self.openai_available = True
+        else:
+            logger.warning("⚠️ Azure OpenAI not configured - local fallback only")
+
+    @classmethod
+    async def create(cls, db_path=None):
+        """Build an instance and verify the Azure deployment asynchronously.
+
+        __init__ stays network-free so construction never blocks an event
+        loop; apps that want startup health reporting await this factory
+        instead, and the probe runs without stalling other startup work.
+        """
+        instance = cls(db_path)
+        if instance.async_client is not None and (
+                os.environ.get("RAG_TEST_CONNECTION")):
+            await instance._test_connection()
+        return instance
+
+    # ------------------------------------------------------------------
+    # Setup helpers
+    # ------------------------------------------------------------------
+
+    def _find_database(self):
+        """Locate the animals SQLite database in the usual places."""
+        possible_paths = [
+            os.environ.get("ZOO_DB_PATH", ""),
+            "zoo_animals.db",
+            "data/zoo_animals.db",
+            os.path.join(os.path.dirname(__file__), "zoo_animals.db"),
+            os.path.join(os.path.dirname(__file__), "data", "zoo_animals.db"),
+        ]
+        for path in possible_paths:
+            if path and os.path.exists(path):
+                logger.info(f"✅ Found animal database at {path}")
+                return path
+        logger.warning("⚠️ No animal database found - DB search disabled")
+        return None
+
+    def _ensure_fts_index(self):
+        """Create/refresh the FTS5 index over the animals table.
+
+        ``LIKE '%keyword%'`` forces a full table scan; an FTS5 inverted index
+        keeps keyword lookup O(log n) as the collection grows, and lets
+        content-field queries ("what eats bamboo") hit characteristics,
+        behavior and diet too.
+        """
+        try:
+            self._conn.execute(
+                """CREATE VIRTUAL TABLE IF NOT EXISTS animals_fts USING fts5(
+                       common_name, characteristics, behavior, diet,
+                       content='animals', content_rowid='id')"""
+            )
+            self._conn.execute("INSERT INTO animals_fts(animals_fts) VALUES('rebuild')")
+            # Expression index so exact-name lookups are a B-tree seek; a
+            # leading-% LIKE can never use an index.
+            self._conn.execute(
+                """CREATE INDEX IF NOT EXISTS idx_animals_name_lower
+                   ON animals(LOWER(common_name))""")
+            self._conn.commit()
+            self._fts_available = True
+            logger.info("✅ animals_fts index ready")
+        except sqlite3.Error as e:
+            # FTS5 may be compiled out of the host SQLite; fall back to LIKE.
+            logger.warning(f"⚠️ FTS5 unavailable, using LIKE search: {e}")
+            self._fts_available = False
+
+    def _load_animals_in_memory(self):
+        """Materialize the animals table as in-process dicts.
+
+        The table is static and tiny, so a one-time SELECT turns every
+        later search into a microsecond dict hit instead of a SQL parse
+        plus B-tree walk.
+        """
+        try:
+            cursor = self._conn.cursor()
+            cursor.row_factory = _animal_row_factory
+            rows = cursor.execute(
+                f"SELECT {_ANIMAL_COLUMNS} FROM animals").fetchall()
+        except sqlite3.Error as e:
+            logger.warning("⚠️ Could not preload animals table: %s", e)
+            return
+        self._animals = {r.common_name.lower(): r for r in rows}
+        for record in rows:
+            searchable = " ".join(
+                (record.common_name, record.characteristics,
+                 record.behavior, record.diet)).lower()
+            for keyword in self._db_keywords:
+                if keyword in searchable:
+                    self._keyword_to_animal.setdefault(keyword, record)
+        logger.info("✅ Preloaded %d animals into memory", len(rows))
+
+    def close(self):
+        """Release the long-lived database connection."""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def _test_connection(self):
+        """Fire a 1-token completion to verify the Azure deployment works."""
+        try:
+            await self.async_client.chat.completions.create(
+                model=self.deployment_name,
+                messages=[{"role": "user", "content": "ping"}],
+                max_tokens=1,
+            )
+            self.openai_available = True
+            logger.info("✅ Azure OpenAI connection OK")
+        except Exception as e:
+            self.openai_available = False
+            logger.error(f"❌ Azure OpenAI connection failed: {e}")
+
+    # ------------------------------------------------------------------
+    # Entity extraction and database search
+    # ------------------------------------------------------------------
+
+    def extract_animal_from_message(self, message):
+        """Return the official animal name mentioned in the message, if any."""
+        return _extract_animal(message.lower())
+
+    def enhanced_animal_search(self, message, animal_entity=None,
+                               message_lower=None):
+        """Search the animals DB, returning the best matching row or None.
+
+        Results are memoized per (entity, message) pair - the table is
+        static for the process lifetime, so repeat questions skip SQLite
+        entirely.
+        """
+        if self._conn is None:
+            return None
+        if message_lower is None:
+            message_lower = message.lower()
+        return self._search_cached(
+            animal_entity.lower() if animal_entity else None, message_lower)
+
+    def _animal_search_uncached(self, entity_lower, message_lower):
+        """Entity lookup first, then keyword fallback; memory before SQL."""
+        if self._animals:
+            if entity_lower:
+                record = self._animals.get(entity_lower)
+                if record is None:
+                    record = next(
+                        (r for name, r in self._animals.items()
+                         if entity_lower in name), None)
+                if record is not None:
+                    logger.info("🔍 Memory hit (direct) for %r", entity_lower)
+                    return record
+            for keyword in self._keyword_re.findall(message_lower):
+                record = self._keyword_to_animal.get(keyword)
+                if record is not None:
+                    logger.info("🔍 Memory hit (keyword %r)", keyword)
+                    return record
+        try:
+            with self._db_lock:
+                cursor = self._conn.cursor()
+                cursor.row_factory = _animal_row_factory
+
+                # Strategy 1: direct entity match.  Exact hit rides the
+                # LOWER(common_name) index; only then fall back to LIKE.
+                if entity_lower:
+                    cursor.execute(_SQL_ANIMAL_EXACT, (entity_lower,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        cursor.execute(
+                            _SQL_ANIMAL_LIKE, (f"%{entity_lower}%",))
+                        row = cursor.fetchone()
+                    if row:
+                        logger.info("🔍 DB hit (direct) for %r", entity_lower)
+                        return row
+
+                # Strategy 2: one regex scan collects every keyword, one
+                # query resolves them all - no per-keyword round-trips.
+                keywords = self._keyword_re.findall(message_lower)
+                if keywords:
+                    if self._fts_available:
+                        cursor.execute(
+                            _SQL_ANIMAL_FTS,
+                            (" OR ".join(f'"{k}"' for k in keywords),))
+                    else:
+                        cursor.execute(
+                            _sql_animal_like_any(len(keywords)),
+                            tuple(f"%{k}%" for k in keywords))
+                    row = cursor.fetchone()
+                    if row:
+                        logger.info("🔍 DB hit (keywords %r)", keywords)
+                        return row
+
+                return None
+        except Exception as e:
+            logger.error(f"❌ Animal search failed: {e}")
+            return None
+
+    def _format_animal_data(self, record):
+        """Render an AnimalRecord into the context block handed to the LLM."""
+        return _format_animal_row(record)
+
+    # ------------------------------------------------------------------
+    # Park information context
+    # ------------------------------------------------------------------
+
+    def get_park_info_context(self, query, query_lower=None):
+        """Build a park-information context block for the query, or None.
+
+        PARK_INFO is static, so the result is memoized on the normalized
+        query text.
+        """
+        return self._park_info_context_impl(
+            query_lower if query_lower is not None else query.lower())
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _park_info_context_impl(query_lower):
+        context_parts = []
+        # One pass over the query collects every triggered category.
+        hits = {m.lastgroup for m in _PARK_CATEGORY_RE.finditer(query_lower)}
+        tokens = frozenset(_WORD_RE.findall(query_lower))
+        animal_hit = bool(_PARK_ANIMAL_TOKEN_MAP.keys() & tokens) or \
+            bool(_PARK_ANIMAL_PHRASE_RE.search(query_lower))
+        gallery_hit = bool(_GALLERY_TOKENS & tokens)
+        # Fingerprint early-exit: most purely animal-knowledge questions
+        # ("what do pandas eat?") trigger nothing here, so skip the whole
+        # branch cascade and the gallery scan.
+        if not hits and not animal_hit and not gallery_hit:
+            return None
+
+        # Rides and thrill attractions.
+        if "ride" in hits:
+            for ride in PARK_INFO["activities"]["Rides"]:
+                if ride["_tokens"] & tokens:
+                    context_parts.append(
+                        f"{ride['name']} ({ride['zone']}): {ride['description']}")
+            if not context_parts:
+                names = ", ".join(r["name"] for r in PARK_INFO["activities"]["Rides"])
+                context_parts.append(f"Thrill rides at the park: {names}.")
+
+        # Family attractions.
+        if "family" in hits:
+            for attraction in PARK_INFO["activities"]["Family"]:
+                if attraction["_tokens"] & tokens:
+                    context_parts.append(
+                        f"{attraction['name']} ({attraction['zone']}): {attraction['description']}")
+            if not any(a["_name_lower"] in query_lower
+                       for a in PARK_INFO["activities"]["Family"]):
+                names = ", ".join(a["name"] for a in PARK_INFO["activities"]["Family"])
+                context_parts.append(f"Family attractions: {names}.")
+
+        # Opening hours.
+        if "hours" in hits:
+            context_parts.append(
+                f"Park hours: {PARK_INFO['hours']['park']} "
+                f"(last entry {PARK_INFO['hours']['last_entry']}). "
+                f"{PARK_INFO['hours']['notes']}")
+
+        # Transport.
+        if "transport" in hits:
+            for mode, info in PARK_INFO["transport"].items():
+                if TRANSPORT_PHRASES[mode] in query_lower or "get" in query_lower:
+                    context_parts.append(info)
+
+        # Zones.
+        if "zone" in hits:
+            for zone, desc in PARK_INFO["zones"].items():
+                context_parts.append(f"{zone}: {desc}")
+
+        # Conservation.
+        if "conservation" in hits:
+            context_parts.append(PARK_INFO["conservation"]["foundation"])
+            context_parts.append(PARK_INFO["conservation"]["programmes"])
+
+        # Gallery overview questions.
+        if "galleries" in hits:
+            context_parts.append("Animal galleries at the park:\n"
+                                 + get_all_galleries_summary())
+
+        # Directions to a specific animal.
+        if "direction" in hits:
+            # Multi-word phrases first so "red panda" beats "panda".
+            match = _PARK_ANIMAL_PHRASE_RE.search(query_lower)
+            if match:
+                animal = match.group(1)
+            else:
+                hit = _PARK_ANIMAL_TOKEN_MAP.keys() & tokens
+                # Resolve the intersection in _PARK_ANIMAL_KEYWORDS
+                # priority order (the token map preserves it) - set
+                # iteration order varies with the hash seed, and a
+                # two-animal query must answer deterministically.
+                animal = next(
+                    (kw for token, kw in _PARK_ANIMAL_TOKEN_MAP.items()
+                     if token in hit),
+                    None) if hit else None
+            if animal:
+                location_info = find_animal_location(animal)
+                if location_info:
+                    context_parts.append(
+                        f"You can find the {animal} at {location_info}.")
+
+        # Detailed gallery info, only when something can actually match it.
+        if animal_hit or gallery_hit or hits & {"direction", "galleries"}:
+            detailed = search_animal_detailed_info(query_lower)
+            for info in detailed[:2]:
+                context_parts.append(
+                    f"{info.name} ({info.zone} zone, {info.location}): "
+                    f"highlights - {'; '.join(info.highlights)}")
+
+        if context_parts:
+            return "\n".join(context_parts)
+        return None
+
+    # ------------------------------------------------------------------
+    # Prompt assembly
+    # ------------------------------------------------------------------
+
+    def classify_query_type(self, query, query_lower=None):
+        """Cheap keyword classifier mapping a query onto a system prompt."""
+        if query_lower is None:
+            query_lower = query.lower()
+        if any(word in query_lower for word in
+               ["hello", "hi ", "hey", "good morning", "good afternoon"]) \
+                or query_lower.strip() in ("hi", "hey"):
+            return "greeting"
+        if any(word in query_lower for word in
+               ["ride", "hours", "open", "ticket", "mtr", "bus", "cable car",
+                "restaurant", "where is", "how to get", "zone"]):
+            return "park_info"
+        if self.extract_animal_from_message(query):
+            return "animal_info"
+        return "general"
+
+    def _compile_prompt_builder(self, query_type):
+        """Return a builder assembling only the fields `query_type` uses.
+
+        The context keys present are almost fully determined by the query
+        type (park_info never carries local_database, greetings carry no
+        context at all), so a per-type specialized function skips the dead
+        branches the generic builder re-evaluates on every call.
+        """
+        if query_type == "greeting":
+            def build(query, context):
+                user_context = context.get("user_context")
+                if user_context:
+                    return (f"{self._USER_HEADER}\n{user_context}\n"
+                            f"VISITOR QUESTION: {query}")
+                return f"VISITOR QUESTION: {query}"
+            return build
+
+        if query_type == "animal_info":
+            def build(query, context):
+                parts = []
+                detected_animal = context.get("detected_animal")
+                if detected_animal:
+                    parts.append(_SEP)
+                    parts.append(
+                        f"⚠️ CRITICAL CURRENT CONTEXT: the visitor is asking "
+                        f"about the {detected_animal}.")
+                    parts.append(_SEP)
+                local_database = context.get("local_database")
+                if local_database:
+                    parts.append(self._DB_HEADER)
+                    parts.append(local_database)
+                user_context = context.get("user_context")
+                if user_context:
+                    parts.append(self._USER_HEADER)
+                    parts.append(user_context)
+                history = context.get("conversation_history")
+                if history:
+                    parts.append(self._HISTORY_HEADER)
+                    parts.append(history)
+                parts.append(_RULES)
+                parts.append(f"VISITOR QUESTION: {query}")
+                return "\n".join(parts)
+            return build
+
+        if query_type == "park_info":
+            def build(query, context):
+                parts = []
+                park_info = context.get("park_info")
+                if park_info:
+                    parts.append(self._PARK_HEADER)
+                    parts.append(park_info)
+                user_context = context.get("user_context")
+                if user_context:
+                    parts.append(self._USER_HEADER)
+                    parts.append(user_context)
+                history = context.get("conversation_history")
+                if history:
+                    parts.append(self._HISTORY_HEADER)
+                    parts.append(history)
+                parts.append(_RULES)
+                parts.append(f"VISITOR QUESTION: {query}")
+                return "\n".join(parts)
+            return build
+
+        return None
+
+    # Context keys that actually contribute prompt text; used by the
+    # no-context fast path below.
+    _CONTEXT_KEYS = ("detected_animal", "local_database", "park_info",
+                     "user_context", "conversation_history")
+
+    def _build_enhanced_prompt(self, query, context):
+        """Assemble the user-role prompt from all available context blocks."""
+        # Fast path: one-shot queries with no context at all (cold starts,
+        # warmup probes) skip the builder machinery entirely.
+        if not any(context.get(key) for key in self._CONTEXT_KEYS):
+            return f"{_RULES}\nVISITOR QUESTION: {query}"
+        builder = self._prompt_builders.get(context.get("query_type"))
+        if builder is not None:
+            prompt = builder(query, context)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("📝 Built prompt (%d chars) for query %r",
+                            len(prompt), query[:60])
+            return prompt
+
+        prompt_parts = []
+
+        detected_animal = context.get("detected_animal")
+        if detected_animal:
+            prompt_parts.append(_SEP)
+            prompt_parts.append(
+                f"⚠️ CRITICAL CURRENT CONTEXT: the visitor is asking about "
+                f"the {detected_animal}.")
+            prompt_parts.append(_SEP)
+
+        local_database = context.get("local_database")
+        if local_database:
+            prompt_parts.append(self._DB_HEADER)
+            prompt_parts.append(local_database)
+
+        park_info = context.get("park_info")
+        if park_info:
+            prompt_parts.append(self._PARK_HEADER)
+            prompt_parts.append(park_info)
+
+        user_context = context.get("user_context")
+        if user_context:
+            prompt_parts.append(self._USER_HEADER)
+            prompt_parts.append(user_context)
+
+        history = context.get("conversation_history")
+        if history:
+            prompt_parts.append(self._HISTORY_HEADER)
+            prompt_parts.append(history)
+
+        prompt_parts.append(_RULES)
+        prompt_parts.append(f"VISITOR QUESTION: {query}")
+
+        prompt = "\n".join(prompt_parts)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("📝 Built prompt (%d chars) for query %r",
+                        len(prompt), query[:60])
+        return prompt
+
+    # ------------------------------------------------------------------
+    # Semantic response cache
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _semantic_cache_key(query_type, detected_animal, query):
+        return f"{query_type}|{detected_animal}|{query.lower().strip()}"
+
+    async def _get_query_embedding(self, text):
+        """Embed the cache key text; returns a normalized np vector or None.
+
+        The source is pinned for the life of the process: when the local
+        quantized embedder is loaded, it is the only source.  Falling
+        back to the Azure endpoint per call would mix 384-dim MiniLM
+        rows with 1536-dim API rows in one stacked matrix and blow up
+        the similarity matmul, so a local failure skips the semantic
+        match for that query instead.
+        """
+        if self._local_embedder is not None:
+            try:
+                return await asyncio.to_thread(self._local_embedder.embed, text)
+            except Exception as e:
+                logger.warning(
+                    "⚠️ Local embed failed, skipping semantic match: %s", e)
+                return None
+        if not (NUMPY_AVAILABLE and self.openai_available and self.async_client):
+            return None
+        try:
+            response = await self.async_client.embeddings.create(
+                model=self.embedding_model, input=text)
+            vec = np.asarray(response.data[0].embedding, dtype=np.float32)
+            return vec / np.linalg.norm(vec)
+        except Exception as e:
+            logger.warning("⚠️ Embedding call failed: %s", e)
+            return None
+
+    async def _semantic_cache_lookup(self, cache_key):
+        """Return a cached response for the key, or None.
+
+        Exact key match is a free dict hit; otherwise one stacked matmul
+        scores every cached embedding at once (a single BLAS GEMV instead of
+        a Python loop of dot products).  Rows from a different
+        (query_type, animal) bucket are masked out - never matching across
+        detected animals avoids paraphrase false-hits between species.
+        """
+        entry = self._sem_cache.get(cache_key)
+        if entry is not None:
+            self._sem_cache.move_to_end(cache_key)
+            logger.info("⚡ Semantic cache exact hit")
+            return entry
+
+        if self._emb_count == 0:
+            return None
+
+        query_emb = await self._get_query_embedding(cache_key)
+        if query_emb is None:
+            return None
+        # Stash per key for the store that follows a miss; bound the
+        # dict so keys whose response never gets cached don't pile up.
+        while len(self._pending_embeddings) >= 256:
+            self._pending_embeddings.pop(next(iter(self._pending_embeddings)))
+        self._pending_embeddings[cache_key] = query_emb
+
+        bucket_id = self._bucket_ids.get(cache_key.rsplit("|", 1)[0])
+        if bucket_id is None:
+            return None
+        n = self._emb_count
+        sims = self._emb_matrix[:n] @ query_emb.astype(np.float32)
+        sims[self._emb_bucket_ids[:n] != bucket_id] = -1.0
+        idx = int(np.argmax(sims))
+        if sims[idx] > self._sem_threshold:
+            logger.info("⚡ Semantic cache hit (sim=%.3f)", float(sims[idx]))
+            key = self._emb_keys[idx]
+            if key in self._sem_cache:
+                self._sem_cache.move_to_end(key)
+                # A hit means no store will follow to consume the stash.
+                self._pending_embeddings.pop(cache_key, None)
+                return self._sem_cache[key]
+        return None
+
+    def _semantic_cache_store(self, cache_key, response):
+        """Insert the response and its embedding under bound.
+
+        The lookup usually embedded the key already (stashed per key in
+        _pending_embeddings); when it did not - notably while the store
+        is still empty and the lookup short-circuits before embedding -
+        the embedding is computed in a background task, so the first
+        entries seed the matrix without delaying the visitor's reply.
+        """
+        self._sem_cache[cache_key] = response
+        self._sem_cache.move_to_end(cache_key)
+        while len(self._sem_cache) > self._sem_cache_max:
+            self._sem_cache.popitem(last=False)
+
+        if not NUMPY_AVAILABLE:
+            return
+        embedding = self._pending_embeddings.pop(cache_key, None)
+        if embedding is not None:
+            self._append_embedding(cache_key, embedding.astype(np.float32))
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._embed_and_append(cache_key))
+        self._embed_tasks.add(task)
+        task.add_done_callback(self._embed_tasks.discard)
+
+    async def _embed_and_append(self, cache_key):
+        """Embed a stored key off the response path and add it to the matrix."""
+        embedding = await self._get_query_embedding(cache_key)
+        # The entry may have been LRU-evicted while the embedding was in
+        # flight; appending a row for it would only produce stale hits.
+        if embedding is not None and cache_key in self._sem_cache:
+            self._append_embedding(cache_key, embedding.astype(np.float32))
+
+    def _append_embedding(self, cache_key, embedding):
+        """Add one row to the stacked similarity matrix.
+
+        Amortized growth: extend the stacked matrix 128 rows at a time so
+        inserts don't reallocate per entry.
+        """
+        if self._emb_matrix is None or self._emb_count == len(self._emb_matrix):
+            grown = np.zeros(
+                (self._emb_count + 128, embedding.shape[0]), dtype=np.float32)
+            ids = np.zeros(self._emb_count + 128, dtype=np.int32)
+            if self._emb_matrix is not None:
+                grown[:self._emb_count] = self._emb_matrix[:self._emb_count]
+                ids[:self._emb_count] = self._emb_bucket_ids[:self._emb_count]
+            self._emb_matrix = grown
+            self._emb_bucket_ids = ids
+
+        bucket = cache_key.rsplit("|", 1)[0]
+        bucket_id = self._bucket_ids.setdefault(bucket, len(self._bucket_ids))
+        self._emb_matrix[self._emb_count] = embedding
+        self._emb_bucket_ids[self._emb_count] = bucket_id
+        self._emb_keys.append(cache_key)
+        self._emb_count += 1
+
+        # Evict the oldest half when the embedding store outgrows the cache
+        # bound - a bulk slice instead of per-entry bookkeeping.
+        if self._emb_count > self._sem_cache_max:
+            half = self._emb_count // 2
+            self._emb_matrix[:self._emb_count - half] = \
+                self._emb_matrix[half:self._emb_count]
+            self._emb_bucket_ids[:self._emb_count - half] = \
+                self._emb_bucket_ids[half:self._emb_count]
+            self._emb_keys = self._emb_keys[half:]
+            self._emb_count -= half
+
+    # ------------------------------------------------------------------
+    # OpenAI dispatch
+    # ------------------------------------------------------------------
+
+    async def _stream_completion(self, prompt, query_type):
+        """Yield reply text chunks from one streamed chat completion.
+
+        Single low-level path for both the streaming and the aggregate
+        callers: always stream=True, so the first token is available
+        ~200-400 ms in instead of after the full completion.
+        """
+        self._pending_requests += 1
+        acquired = False
+        try:
+            async with self._sem:
+                acquired = True
+                self._pending_requests -= 1
+                self._in_flight_requests += 1
+                try:
+                    response = await self.async_client.chat.completions.create(
+                        model=self.deployment_name,
+                        messages=[
+                            {"role": "system",
+                             "content": self.system_prompts.get(
+                                 query_type, self.system_prompts["general"])},
+                            {"role": "user", "content": prompt},
+                        ],
+                        max_tokens=self.max_tokens,
+                        temperature=self.temperature,
+                        stream=True,
+                    )
+                    async for chunk in response:
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            yield chunk.choices[0].delta.content
+                finally:
+                    self._in_flight_requests -= 1
+        finally:
+            if not acquired:
+                # Cancelled while queued: undo the waiting count.
+                self._pending_requests -= 1
+
+    def concurrency_stats(self):
+        """Snapshot of the completion gate for health/debug endpoints."""
+        return {
+            "limit": self.max_concurrent,
+            "in_flight": self._in_flight_requests,
+            "waiting": self._pending_requests,
+        }
+
+    async def _collect_completion(self, prompt, query_type):
+        """Collect one streamed completion into the full reply text."""
+        parts = []
+        async for piece in self._stream_completion(prompt, query_type):
+            parts.append(piece)
+        return "".join(parts).strip() or None
+
+    async def _call_openai_api(self, prompt, query_type):
+        """One completion with up to 3 attempts on transient errors.
+
+        A single 429 burst used to flip openai_available off for the
+        process lifetime; now only exhausting every retry does, and a
+        background probe flips it back once Azure recovers.
+        """
+        try:
+            if TENACITY_AVAILABLE:
+                async for attempt in AsyncRetrying(
+                        wait=wait_random_exponential(multiplier=1, max=30),
+                        stop=stop_after_attempt(3),
+                        retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+                        reraise=True):
+                    with attempt:
+                        return await self._collect_completion(prompt, query_type)
+            # Manual fallback: same policy (3 attempts, capped exponential
+            # backoff with jitter) without the tenacity dependency.
+            for attempt in range(3):
+                try:
+                    return await self._collect_completion(prompt, query_type)
+                except _RETRYABLE_ERRORS:
+                    if attempt == 2:
+                        raise
+                    await asyncio.sleep(
+                        min(30, 2 ** attempt + random.random()))
+        except Exception as e:
+            logger.error(f"❌ OpenAI call failed: {e}")
+            self.openai_available = False
+            self._schedule_reprobe()
+            return None
+
+    def _schedule_reprobe(self, delay=60):
+        """Re-probe the deployment in the background after an outage."""
+        if self._reprobe_task is not None and not self._reprobe_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+
+        async def _reprobe():
+            await asyncio.sleep(delay)
+            await self._test_connection()
+
+        self._reprobe_task = loop.create_task(_reprobe())
+
+    async def stream_query_with_openai(self, query, context=None, user_id="default"):
+        """Yield the reply as text chunks (for TTS pipelines)."""
+        context = context or {}
+        query_type = context.get("query_type") or self.classify_query_type(query)
+        prompt = self._build_enhanced_prompt(query, context)
+        if not (self.openai_available and self.async_client):
+            yield self._generate_enhanced_local_fallback(query, context)
+            return
+        try:
+            async for piece in self._stream_completion(prompt, query_type):
+                yield piece
+        except Exception as e:
+            logger.error(f"❌ OpenAI stream failed: {e}")
+            yield self._generate_enhanced_local_fallback(query, context)
+
+    async def speak_streamed(self, query, context=None, user_id="default",
+                             tts=None):
+        """Yield TTS audio chunks while the LLM reply is still generating.
+
+        Consumes ``stream_query_with_openai`` and forwards each complete
+        sentence to ElevenLabs as soon as its boundary appears, so LLM
+        generation, TTS synthesis and audio delivery overlap: total latency
+        drops from t_llm + t_tts to max(t_llm, t_tts) + t_first_sentence.
+        """
+        if tts is None:
+            if not hasattr(self, "_tts"):
+                from elevenlabs_tts import ElevenLabsTTS
+                self._tts = ElevenLabsTTS()
+            tts = self._tts
+
+        sentences = asyncio.Queue()
+
+        async def _produce():
+            buffer = ""
+            try:
+                async for text_chunk in self.stream_query_with_openai(
+                        query, context, user_id):
+                    buffer += text_chunk
+                    pos = 0
+                    for match in _SENT_RE.finditer(buffer):
+                        if match.end() == len(buffer) and len(match.group()) == 1:
+                            # Bare punctuation at the buffer edge: the
+                            # next chunk decides whether it ends the
+                            # sentence ("3." + "14") - hold it back.
+                            break
+                        sentence = buffer[pos:match.end()].strip()
+                        pos = match.end()
+                        if sentence:
+                            await sentences.put(sentence)
+                    if pos:
+                        buffer = buffer[pos:]
+                if buffer.strip():
+                    await sentences.put(buffer.strip())
+            finally:
+                await sentences.put(None)
+
+        producer = asyncio.create_task(_produce())
+        try:
+            while True:
+                sentence = await sentences.get()
+                if sentence is None:
+                    break
+                async for audio_chunk in tts._stream_audio(sentence):
+                    yield audio_chunk
+        finally:
+            producer.cancel()
+
+    # ------------------------------------------------------------------
+    # Main entry point
+    # ------------------------------------------------------------------
+
+    async def process_query_with_openai(self, query, context=None, user_id="default"):
+        """Answer a visitor query; returns a result dict.
+
+        The dict carries ``response``, ``source`` (openai/local),
+        ``query_type`` and ``detected_animal``.
+        """
+        context = dict(context) if context else {}
+        # Lower once; every downstream consumer reuses the same buffer
+        # instead of re-allocating and re-scanning the string.
+        query_lower = query.lower()
+        context["_query_lower"] = query_lower
+        query_type = (context.get("query_type")
+                      or self.classify_query_type(query, query_lower))
+        context["query_type"] = query_type
+
+        animal_entity = self.extract_animal_from_message(query)
+        if animal_entity:
+            context["detected_animal"] = animal_entity
+
+        # The SQLite read is synchronous; run it off-loop so other coroutines
+        # (concurrent visitors, WebSocket streams) keep progressing.
+        animal_data = await asyncio.to_thread(
+            self.enhanced_animal_search, query, animal_entity, query_lower)
+        # Stash the row (or the miss) so the fallback path never repeats the
+        # matcher scan or the DB round-trip.
+        context["_cached_animal_row"] = animal_data
+        if animal_data:
+            context["local_database"] = self._format_animal_data(animal_data)
+
+        park_context = self.get_park_info_context(query, query_lower)
+        if park_context:
+            context["park_info"] = park_context
+
+        cache_key = self._semantic_cache_key(
+            query_type, context.get("detected_animal"), query)
+        cached = await self._semantic_cache_lookup(cache_key)
+        if cached is not None:
+            return {
+                "response": cached,
+                "source": "cache",
+                "query_type": query_type,
+                "detected_animal": animal_entity,
+            }
+
+        if self.openai_available and self.async_client:
+            prompt = self._build_enhanced_prompt(query, context)
+            response = await self._call_openai_api(prompt, query_type)
+            if response:
+                self._semantic_cache_store(cache_key, response)
+                return {
+                    "response": response,
+                    "source": "openai",
+                    "query_type": query_type,
+                    "detected_animal": animal_entity,
+                }
+
+        fallback = self._generate_enhanced_local_fallback(query, context)
+        return {
+            "response": fallback,
+            "source": "local",
+            "query_type": query_type,
+            "detected_animal": animal_entity,
+        }
+
+    async def process_queries(self, queries, contexts=None, user_ids=None):
+        """Answer many queries concurrently; returns results in order.
+
+        Each query runs the full pipeline; the completions overlap on the
+        event loop instead of queueing behind each other, bounded by the
+        shared semaphore so a big batch cannot blow through the Azure
+        deployment's rate limit. Failures come back as exception objects
+        in their slot (gather with return_exceptions) rather than killing
+        the whole batch.
+        """
+        contexts = contexts or [None] * len(queries)
+        user_ids = user_ids or ["default"] * len(queries)
+        return await asyncio.gather(
+            *(self.process_query_with_openai(query, context, user_id)
+              for query, context, user_id in zip(queries, contexts, user_ids)),
+            return_exceptions=True,
+        )
+
+    async def submit_batch(self, queries, completion_window="24h",
+                           poll_interval=60, wait=False):
+        """Submit queries through the Azure OpenAI Batch API.
+
+        Meant for non-interactive work - precomputing answers for the
+        static FAQ set to warm the caches - where the ~24h turnaround is
+        irrelevant and batch pricing halves the token cost. Returns the
+        batch object (or the final one when ``wait`` is true).
+        """
+        if not (self.openai_available and self.async_client):
+            return None
+        lines = []
+        for i, query in enumerate(queries):
+            query_type = self.classify_query_type(query)
+            lines.append(json.dumps({
+                "custom_id": f"zoo-query-{i}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": self.deployment_name,
+                    "messages": [
+                        {"role": "system",
+                         "content": self.system_prompts[query_type]},
+                        {"role": "user", "content": query},
+                    ],
+                    "max_tokens": self.max_tokens,
+                    "temperature": self.temperature,
+                },
+            }, ensure_ascii=False))
+        payload = io.BytesIO("\n".join(lines).encode("utf-8"))
+        payload.name = "zoo_batch.jsonl"
+        upload = await self.async_client.files.create(
+            file=payload, purpose="batch")
+        batch = await self.async_client.batches.create(
+            input_file_id=upload.id,
+            endpoint="/v1/chat/completions",
+            completion_window=completion_window,
+        )
+        logger.info("📦 Submitted batch %s (%d queries)", batch.id, len(queries))
+        if not wait:
+            return batch
+        # Poll with capped exponential backoff until Azure settles the batch.
+        delay = poll_interval
+        while batch.status in ("validating", "in_progress", "finalizing"):
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 900)
+            batch = await self.async_client.batches.retrieve(batch.id)
+        logger.info("📦 Batch %s finished: %s", batch.id, batch.status)
+        return batch
+
+    # ------------------------------------------------------------------
+    # Local fallback
+    # ------------------------------------------------------------------
+
+    def build_contextual_response(self, record, query, query_lower=None):
+        """Template a spoken answer from an AnimalRecord without the LLM."""
+        if query_lower is None:
+            query_lower = query.lower()
+
+        if any(word in query_lower for word in ["where", "find", "location"]):
+            return _LOC_T.format(record)
+        if any(word in query_lower for word in ["eat", "food", "diet", "feed"]):
+            return _DIET_T.format(record)
+        if any(word in query_lower for word in ["do", "behavior", "play", "sleep"]):
+            return _BEHAVIOR_T.format(record)
+        if any(word in query_lower for word in
+               ["endangered", "conservation", "protect", "rare"]):
+            return _CONSERVATION_T.format(record)
+        return _GENERAL_T.format(record)
+
+    def _generate_enhanced_local_fallback(self, query, context):
+        """Compose an answer from local data when OpenAI is unavailable."""
+        animal_entity = (context.get("detected_animal")
+                         or self.extract_animal_from_message(query))
+        query_lower = context.get("_query_lower") or query.lower()
+        if "_cached_animal_row" in context:
+            animal_data = context["_cached_animal_row"]
+        else:
+            animal_data = self.enhanced_animal_search(
+                query, animal_entity, query_lower)
+        if animal_data:
+            return self.build_contextual_response(animal_data, query, query_lower)
+
+        park_context = self.get_park_info_context(query, query_lower)
+        if park_context:
+            first_line = park_context.split("\n")[0]
+            return f"Here's what I know: {first_line}"
+
+        if animal_entity:
+            location = find_animal_location(animal_entity)
+            if location:
+                return f"You can meet our {animal_entity} at {location}!"
+
+        return ("I'm not sure about that one, but I'd love to tell you about "
+                "our pandas, penguins and sea lions - just ask!")
+
+
+# ---------------------------------------------------------------------------
+# Manual smoke test
+# ---------------------------------------------------------------------------
+
+async def test_enhanced_rag():
+    """Run a handful of representative queries through the pipeline."""
+    logging.basicConfig(level=logging.INFO)
+    rag = EnhancedRAGWithOpenAI()
+    test_queries = [
+        "Hello there!",
+        "Tell me about the giant pandas",
+        "What do capybaras eat?",
+        "Where can I find the penguins?",
+        "What time does the park close?",
+        "How do I get to the park by MTR?",
+    ]
+    # Fan the queries out concurrently (TaskGroup, 3.11+) instead of paying
+    # one full round-trip per query in sequence.
+    async with asyncio.TaskGroup() as tg:
+        tasks = [(query, tg.create_task(rag.process_query_with_openai(query)))
+                 for query in test_queries]
+    for query, task in tasks:
+        result = task.result()
+        print(f"\nQ: {query}\nA [{result['source']}]: {result['response']}")
+
+
+if __name__ == "__main__":
+    asyncio.run(test_enhanced_rag())
@@ -0,0 +1,484 @@
+"""
+WebSocket audio streamer for the ESP32 zoo guide units.
+
+Takes the assistant's reply text, runs it through TTS and pushes the audio
+to an ESP32 over its WebSocket connection.  Two paths exist:
+
+* ``stream_mp3_to_esp32`` - forwards MP3 chunks to the unit as the TTS
+  service produces them (the unit decodes MP3 with its helix decoder),
+* a legacy path that buffers the full MP3, converts it to 16 kHz mono
+  16-bit WAV on the server and streams that.
+"""
+
+import asyncio
+import io
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import socket
+import struct
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import miniaudio
+    MINIAUDIO_AVAILABLE = True
+except ImportError:
+    MINIAUDIO_AVAILABLE = False
+
+try:
+    from pydub import AudioSegment
+    PYDUB_AVAILABLE = True
+except ImportError:
+    PYDUB_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Resolved once: ffmpeg driven directly over pipes beats pydub, which
+# round-trips through temp files and an extra PCM copy per call.
+_FFMPEG = shutil.which("ffmpeg")
+
+if ORJSON_AVAILABLE:
+    def _dumps(payload):
+        # orjson serializes straight to UTF-8 bytes in C; json.dumps
+        # builds a str that the WebSocket layer encodes a second time.
+        return orjson.dumps(payload)
+else:
+    def _dumps(payload):
+        return json.dumps(payload, separators=(",", ":")).encode()
+
+# Audio format the ESP32 I2S pipeline is configured for.
+ESP32_SAMPLE_RATE = 16000
+ESP32_CHANNELS = 1
+ESP32_SAMPLE_WIDTH = 2  # bytes -> 16-bit
+
+# 16KB per frame: two MTU-sized TCP segments after WS framing, halving
+# frame-header and syscall overhead vs 8KB while staying inside the unit
+# receive buffer.  Overridable per deployment.
+DEFAULT_CHUNK_SIZE = int(os.environ.get("ESP32_WS_CHUNK", "16384"))
+
+# Binary framing protocol (replaces the tts_start/tts_complete JSON
+# envelopes the unit used to parse with cJSON): a stream opens with a
+# 1-byte marker - 0x01 for WAV/PCM, 0x03 for MP3 - plus a packed header
+# (total_bytes, sample_rate, channels, bits, num_chunks; zeros where the
+# value is unknown up front), and closes with 0x02 plus the byte total.
+FRAME_AUDIO_START = 0x01
+FRAME_AUDIO_END = 0x02
+FRAME_MP3_START = 0x03
+HEADER_FMT = "<IIHHH"
+
+# Sentence boundary: terminator followed by whitespace or end of text, so
+# "3.14" inside a sentence does not split it.
+_SENT_RE = re.compile(r"[.!?](?:\s|$)")
+_TERMINATOR_RE = re.compile(r"[.!?]")
+
+
+def _wav_header(pcm_len, sample_rate=ESP32_SAMPLE_RATE,
+                channels=ESP32_CHANNELS, sample_width=ESP32_SAMPLE_WIDTH):
+    """Build the 44-byte RIFF header for a PCM blob."""
+    byte_rate = sample_rate * channels * sample_width
+    block_align = channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + pcm_len, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, block_align,
+        sample_width * 8,
+        b"data", pcm_len)
+
+
+class ESP32TTSStreamer:
+    """Streams TTS audio for one ESP32 WebSocket connection."""
+
+    def __init__(self, websocket, tts):
+        self.websocket = websocket
+        self.tts = tts
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self._sock = self._find_socket()
+        self._tune_socket()
+        # Reusable BytesIO pair for the pydub fallback: conversion-rate
+        # allocations otherwise scale with audio size and churn the GC.
+        self._buf_pool = queue.SimpleQueue()
+
+    def _find_socket(self):
+        """Dig the raw TCP socket out of the WebSocket, if reachable."""
+        transport = getattr(self.websocket, "transport", None)
+        if transport is not None:
+            try:
+                return transport.get_extra_info("socket")
+            except Exception:
+                return None
+        return None
+
+    # Write-side buffering for one utterance: enough kernel/transport
+    # headroom that the event loop keeps the pipe full between chunk
+    # sends without buffering a whole response in userspace.
+    SNDBUF_SIZE = 256 * 1024
+    WRITE_HIGH_WATER = 256 * 1024
+    WRITE_LOW_WATER = 64 * 1024
+
+    def _tune_socket(self):
+        """Disable Nagle (and delayed ACKs where supported) on the link.
+
+        4-8KB TTS chunks interact badly with Nagle: each send can stall
+        on the 40 ms ACK timer of the ESP32's slow Wi-Fi return path.
+        TCP_NODELAY flushes every send_bytes immediately; TCP_QUICKACK
+        (Linux) stops the kernel coalescing ACKs on our side.
+
+        The send buffer and the transport's flow-control watermarks are
+        widened to a few utterance-chunks so writes drain asynchronously
+        instead of the default limits forcing a drain-wait per chunk.
+        """
+        if self._sock is None:
+            return
+        try:
+            self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_SNDBUF, self.SNDBUF_SIZE)
+            self._quickack()
+            logger.info("⚡ TCP_NODELAY enabled for ESP32 stream")
+        except OSError as e:
+            logger.warning("⚠️ Could not tune ESP32 socket: %s", e)
+        transport = getattr(self.websocket, "transport", None)
+        if transport is not None:
+            try:
+                transport.set_write_buffer_limits(
+                    high=self.WRITE_HIGH_WATER, low=self.WRITE_LOW_WATER)
+            except (AttributeError, RuntimeError):
+                pass
+
+    def _quickack(self):
+        """Re-arm TCP_QUICKACK; the kernel clears it after each ACK."""
+        if self._sock is not None and hasattr(socket, "TCP_QUICKACK"):
+            try:
+                self._sock.setsockopt(
+                    socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+            except OSError:
+                pass
+
+    async def _send_json(self, payload):
+        """Send a JSON control envelope on the text opcode.
+
+        Audio travels in binary frames; the unit's JSON parser only
+        looks at text frames, so control messages go out as text.  The
+        payload is serialized with orjson when available.
+        """
+        try:
+            await self.websocket.send_text(_dumps(payload).decode())
+        except Exception as e:
+            logger.warning("⚠️ Control message to ESP32 failed: %s", e)
+
+    async def stream_response_to_esp32(self, text):
+        """Speak `text` on the unit; returns True on success.
+
+        Prefers the streaming MP3 path: chunks go out as the TTS service
+        yields them, so synthesis, transfer and playback overlap and the
+        unit starts speaking after the first chunk instead of after the
+        full synthesis + conversion (~N+M serialized becomes ~max(N, M)).
+        The buffered WAV conversion survives only as the fallback for TTS
+        backends that cannot stream.
+        """
+        if hasattr(self.tts, "_stream_audio"):
+            return await self.stream_mp3_to_esp32(text)
+
+        mp3_bytes = await self.tts.create_audio_response_async(text)
+        if not mp3_bytes:
+            return False
+        pcm = await self._convert_to_esp32_format(mp3_bytes)
+        if not pcm:
+            return False
+        return await self._stream_pcm_to_esp32(pcm)
+
+    async def stream_mp3_to_esp32(self, text):
+        """Forward MP3 chunks to the unit as the TTS service produces them."""
+        try:
+            await self.websocket.send_bytes(
+                struct.pack("<B", FRAME_MP3_START)
+                + struct.pack(HEADER_FMT, 0, 0, 0, 0, 0))
+            total = 0
+            # Coalesce the TTS service's arbitrary-sized chunks into
+            # aligned frames so every send (bar the last) is exactly
+            # chunk_size bytes on the wire.
+            buf = bytearray(self.chunk_size)
+            view = memoryview(buf)
+            filled = 0
+            async for chunk in self.tts._stream_audio(text):
+                offset = 0
+                while offset < len(chunk):
+                    take = min(self.chunk_size - filled, len(chunk) - offset)
+                    view[filled:filled + take] = chunk[offset:offset + take]
+                    filled += take
+                    offset += take
+                    if filled == self.chunk_size:
+                        await self.websocket.send_bytes(view)
+                        total += filled
+                        filled = 0
+            # The end marker rides on the back of the final partial
+            # chunk: one frame (and one TCP segment under NODELAY)
+            # instead of two per utterance.
+            if filled:
+                total += filled
+                await self.websocket.send_bytes(
+                    bytes(view[:filled])
+                    + struct.pack("<BI", FRAME_AUDIO_END, total))
+            else:
+                await self.websocket.send_bytes(
+                    struct.pack("<BI", FRAME_AUDIO_END, total))
+            logger.info("⚡ Streamed %d MP3 bytes to ESP32", total)
+            return total > 0
+        except Exception as e:
+            logger.error("❌ MP3 stream to ESP32 failed: %s", e)
+            return False
+
+    async def _convert_to_esp32_format(self, mp3_bytes):
+        """Convert an MP3 blob to the unit's WAV format (legacy path).
+
+        Returns raw 16-bit LE PCM: the binary frame header already
+        carries rate/channels/bits, so the WAV container was vestigial -
+        dropping it removes a header prepend plus a full-buffer copy.
+
+        Decoder priority: miniaudio (in-process, no subprocess at all),
+        then ffmpeg driven directly over pipes, then pydub.  The blocking
+        decoders run in a worker thread so other connected units keep
+        streaming; the ffmpeg path is natively async via
+        create_subprocess_exec.
+        """
+        if MINIAUDIO_AVAILABLE:
+            pcm = await asyncio.to_thread(self._convert_miniaudio, mp3_bytes)
+            if pcm:
+                return pcm
+        if _FFMPEG:
+            pcm = await self._convert_with_ffmpeg(mp3_bytes)
+            if pcm:
+                return pcm
+        if PYDUB_AVAILABLE:
+            return await asyncio.to_thread(self._convert_pydub, mp3_bytes)
+        logger.error("❌ No MP3 decoder available for conversion")
+        return None
+
+    def _convert_miniaudio(self, mp3_bytes):
+        """In-process decode straight to 16 kHz/mono/s16."""
+        try:
+            decoded = miniaudio.decode(
+                mp3_bytes,
+                nchannels=ESP32_CHANNELS,
+                sample_rate=ESP32_SAMPLE_RATE,
+                output_format=miniaudio.SampleFormat.SIGNED16)
+            # Zero-copy byte window over the sample array.
+            return memoryview(decoded.samples).cast("B")
+        except Exception as e:
+            logger.warning("⚠️ miniaudio decode failed: %s", e)
+            return None
+
+    async def _convert_with_ffmpeg(self, mp3_bytes):
+        """Drive ffmpeg over pipes: MP3 in, raw s16le PCM out.
+
+        No temp files, no intermediate container, and the subprocess IO
+        is awaited on the loop instead of blocking a thread.
+        """
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                _FFMPEG, "-v", "error",
+                "-f", "mp3", "-i", "pipe:0",
+                "-ar", str(ESP32_SAMPLE_RATE),
+                "-ac", str(ESP32_CHANNELS),
+                "-f", "s16le", "pipe:1",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.DEVNULL)
+            pcm, _ = await proc.communicate(mp3_bytes)
+            if proc.returncode != 0 or not pcm:
+                logger.warning("⚠️ ffmpeg decode failed (rc=%s)",
+                               proc.returncode)
+                return None
+            return pcm
+        except Exception as e:
+            logger.warning("⚠️ ffmpeg decode failed: %s", e)
+            return None
+
+    def _get_buffer(self, data=b""):
+        """Check a BytesIO out of the pool (or make one), primed with data."""
+        try:
+            buf = self._buf_pool.get_nowait()
+            buf.seek(0)
+            buf.truncate()
+        except queue.Empty:
+            buf = io.BytesIO()
+        if data:
+            buf.write(data)
+            buf.seek(0)
+        return buf
+
+    def _convert_pydub(self, mp3_bytes):
+        """pydub fallback for hosts without miniaudio or an ffmpeg binary."""
+        in_buf = self._get_buffer(mp3_bytes)
+        try:
+            audio = AudioSegment.from_mp3(in_buf)
+            audio = (audio.set_frame_rate(ESP32_SAMPLE_RATE)
+                          .set_channels(ESP32_CHANNELS)
+                          .set_sample_width(ESP32_SAMPLE_WIDTH))
+            # raw_data is the decoded PCM the segment already holds;
+            # exporting to WAV just to slice the 44-byte header back off
+            # would round-trip the whole payload through ffmpeg again.
+            return audio.raw_data
+        except Exception as e:
+            logger.error("❌ MP3 -> PCM conversion failed: %s", e)
+            return None
+        finally:
+            # Return the (already grown) buffer for the next conversion.
+            self._buf_pool.put(in_buf)
+
+    async def _stream_pcm_to_esp32(self, pcm,
+                                   sample_rate=ESP32_SAMPLE_RATE,
+                                   channels=ESP32_CHANNELS,
+                                   sample_width=ESP32_SAMPLE_WIDTH):
+        """Send raw 16-bit LE PCM to the unit in chunks.
+
+        The format parameters default to the target format
+        _convert_to_esp32_format just produced; the binary frame header
+        carries them, so no container wraps the payload.
+        """
+        try:
+            total_bytes = len(pcm)
+            num_chunks = -(-total_bytes // self.chunk_size)
+            header = struct.pack("<B", FRAME_AUDIO_START) + struct.pack(
+                HEADER_FMT, total_bytes, sample_rate, channels,
+                sample_width * 8, num_chunks)
+            # Zero-copy windows: bytes slicing would copy every chunk,
+            # doubling memory traffic for the whole blob; memoryview
+            # slices are O(1) and send_bytes takes any buffer object.
+            view = memoryview(pcm)
+            # The header rides in front of the first audio chunk - one
+            # frame instead of a JSON envelope plus a separate chunk.
+            # The end marker is coalesced onto whichever frame carries
+            # the last audio byte - the unit knows total_bytes from the
+            # header and parses the trailing 5 bytes as the marker - so
+            # an utterance never costs a separate end-of-stream segment.
+            end_frame = struct.pack("<BI", FRAME_AUDIO_END, total_bytes)
+            first = bytes(view[:self.chunk_size])
+            bytes_sent = len(first)
+            if bytes_sent >= total_bytes:
+                await self.websocket.send_bytes(header + first + end_frame)
+            else:
+                await self.websocket.send_bytes(header + first)
+                chunk_number = 1
+                while bytes_sent < total_bytes:
+                    chunk = view[bytes_sent:bytes_sent + self.chunk_size]
+                    bytes_sent += len(chunk)
+                    if bytes_sent >= total_bytes:
+                        await self.websocket.send_bytes(
+                            bytes(chunk) + end_frame)
+                        break
+                    # No hand-pacing: send_bytes already awaits when the
+                    # transport write buffer hits its high-water mark,
+                    # which is the real backpressure signal.  Yield the
+                    # loop every 32 chunks so other streams get a turn
+                    # without adding delay.
+                    await self.websocket.send_bytes(chunk)
+                    chunk_number += 1
+                    if chunk_number & 31 == 0:
+                        self._quickack()
+                        await asyncio.sleep(0)
+            logger.info("⚡ Streamed %d PCM bytes to ESP32", bytes_sent)
+            return True
+        except Exception as e:
+            logger.error("❌ PCM stream to ESP32 failed: %s", e)
+            return False
+
+    async def _generate_sentence_audio(self, sentence):
+        """Synthesize one sentence; returns (audio_bytes, format) or (None, None)."""
+        if hasattr(self.tts, "_stream_audio"):
+            chunks = [c async for c in self.tts._stream_audio(sentence)]
+            audio = b"".join(chunks)
+            if audio:
+                return audio, "mp3"
+            return None, None
+        mp3_bytes = await self.tts.create_audio_response_async(sentence)
+        if not mp3_bytes:
+            return None, None
+        pcm = await self._convert_to_esp32_format(mp3_bytes)
+        if not pcm:
+            return None, None
+        return pcm, "pcm"
+
+    async def _send_audio_blob(self, audio_bytes, audio_format):
+        """Send one prepared audio blob with start/complete bracketing."""
+        if audio_format == "pcm":
+            return await self._stream_pcm_to_esp32(audio_bytes)
+        num_chunks = -(-len(audio_bytes) // self.chunk_size)
+        header = struct.pack("<B", FRAME_MP3_START) + struct.pack(
+            HEADER_FMT, len(audio_bytes), 0, 0, 0, num_chunks)
+        end_frame = struct.pack("<BI", FRAME_AUDIO_END, len(audio_bytes))
+        view = memoryview(audio_bytes)
+        first = bytes(view[:self.chunk_size])
+        if len(first) >= len(audio_bytes):
+            await self.websocket.send_bytes(header + first + end_frame)
+            return True
+        await self.websocket.send_bytes(header + first)
+        for offset in range(len(first), len(audio_bytes), self.chunk_size):
+            chunk = view[offset:offset + self.chunk_size]
+            if offset + len(chunk) >= len(audio_bytes):
+                await self.websocket.send_bytes(bytes(chunk) + end_frame)
+            else:
+                await self.websocket.send_bytes(chunk)
+        return True
+
+    async def stream_text_chunks_to_esp32(self, text_stream):
+        """Speak a streamed text reply sentence by sentence.
+
+        Accepts an async iterator of text chunks (e.g. LLM deltas), cuts
+        them into sentences and speaks each one as soon as it is complete.
+        TTS for the next sentences runs in the background while the
+        current one streams, bounded by a small FIFO queue (depth 2) so
+        the pipeline to the unit never idles waiting on synthesis but a
+        long reply cannot buffer unbounded audio.  FIFO order keeps the
+        sentences in spoken order.
+        """
+        queue = asyncio.Queue(maxsize=2)
+
+        async def produce():
+            # Pieces are joined only when a chunk actually carries a
+            # terminator, and the compiled regex walks each character
+            # once - the old any()/find() scan re-walked the whole
+            # growing buffer per token (O(n^2) over a streamed reply).
+            pieces = []
+            async for text_chunk in text_stream:
+                pieces.append(text_chunk)
+                if not _TERMINATOR_RE.search(text_chunk):
+                    continue
+                text = "".join(pieces)
+                last = 0
+                for match in _SENT_RE.finditer(text):
+                    sentence = text[last:match.end()].strip()
+                    last = match.end()
+                    if sentence:
+                        await queue.put(asyncio.create_task(
+                            self._generate_sentence_audio(sentence)))
+                pieces = [text[last:]] if last < len(text) else []
+            tail = "".join(pieces).strip()
+            if tail:
+                await queue.put(asyncio.create_task(
+                    self._generate_sentence_audio(tail)))
+            await queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        spoken = 0
+        try:
+            while True:
+                task = await queue.get()
+                if task is None:
+                    break
+                audio_bytes, audio_format = await task
+                if audio_bytes:
+                    await self._send_audio_blob(audio_bytes, audio_format)
+                    spoken += 1
+        finally:
+            producer.cancel()
+        await self._send_json({"type": "tts_complete", "sentences": spoken})
+        return spoken
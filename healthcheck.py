@@ -0,0 +1,221 @@
+"""
+Health probes for the zoo chatbot server.
+
+Exposes the checks behind the /health and /health/ready endpoints:
+backing database, Redis cache, the vector-store HTTP service, the local
+SQLite animals database and basic host resources.  Kubernetes hits these
+every few seconds, so the checks must stay cheap.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+
+try:
+    from sqlalchemy import create_engine, text
+    SQLALCHEMY_AVAILABLE = True
+except ImportError:
+    SQLALCHEMY_AVAILABLE = False
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "")
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+VECTORDB_URL = os.environ.get("VECTORDB_URL", "")
+
+# ---------------------------------------------------------------------------
+# Client singletons
+# ---------------------------------------------------------------------------
+# Probes arrive every 5-10s from the kubelet; rebuilding an engine, a
+# Redis client or a TLS session per probe pays a fresh TCP (and TLS)
+# handshake each time and leaks sockets under churn.  Each client is
+# created once, lazily, and reused with its own connection pooling.
+
+_engine = None
+_redis = None
+_vector_session = None
+
+
+def _get_engine():
+    global _engine
+    if _engine is None and SQLALCHEMY_AVAILABLE and DATABASE_URL:
+        # One pooled connection is plenty for a probe, and pre_ping
+        # recycles it transparently if the server dropped it between
+        # probes instead of failing the first check after an idle spell.
+        _engine = create_engine(
+            DATABASE_URL, pool_pre_ping=True, pool_size=1, max_overflow=0)
+    return _engine
+
+
+def _get_redis():
+    global _redis
+    if _redis is None and REDIS_AVAILABLE:
+        _redis = redis.from_url(
+            REDIS_URL, socket_timeout=2, socket_connect_timeout=2)
+    return _redis
+
+
+def _get_vector_session():
+    global _vector_session
+    if _vector_session is None and REQUESTS_AVAILABLE:
+        _vector_session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        _vector_session.mount("http://", adapter)
+        _vector_session.mount("https://", adapter)
+    return _vector_session
+
+
+# ---------------------------------------------------------------------------
+# Individual checks
+# ---------------------------------------------------------------------------
+
+def check_database_connection():
+    """True if the backing SQL database answers a trivial query."""
+    engine = _get_engine()
+    if engine is None:
+        return False
+    try:
+        with engine.connect() as conn:
+            conn.scalar(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.warning("⚠️ Database health check failed: %s", e)
+        return False
+
+
+def check_redis_connection():
+    """True if Redis answers PING."""
+    client = _get_redis()
+    if client is None:
+        return False
+    try:
+        return bool(client.ping())
+    except Exception as e:
+        logger.warning("⚠️ Redis health check failed: %s", e)
+        return False
+
+
+def check_vectordb_connection():
+    """True if the vector-store service answers its health endpoint."""
+    session = _get_vector_session()
+    if session is None or not VECTORDB_URL:
+        return False
+    try:
+        response = session.get(f"{VECTORDB_URL}/health", timeout=2)
+        return response.status_code == 200
+    except Exception as e:
+        logger.warning("⚠️ VectorDB health check failed: %s", e)
+        return False
+
+
+@functools.lru_cache(maxsize=1)
+def _find_database():
+    """Locate the animals SQLite database in the usual places.
+
+    The candidate list and the deploy layout are fixed for the life of
+    the process, so the stat() walk runs once and every later probe
+    reuses the resolved path.
+    """
+    possible_paths = [
+        os.environ.get("ZOO_DB_PATH", ""),
+        "zoo_animals.db",
+        "data/zoo_animals.db",
+        os.path.join(os.path.dirname(__file__), "zoo_animals.db"),
+        os.path.join(os.path.dirname(__file__), "data", "zoo_animals.db"),
+    ]
+    for path in possible_paths:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+def check_sqlite_database():
+    """True if the local animals database file is present."""
+    return _find_database() is not None
+
+
+# psutil's virtual_memory/disk_usage read procfs and statvfs on every
+# call; host-level numbers don't move meaningfully between probes, so a
+# one-second snapshot is shared across them.
+_STATS_TTL = 1.0
+_stats_cache = None
+_stats_expiry = 0.0
+
+
+def get_system_stats():
+    """Memory and disk usage of the host, for /health/ready."""
+    global _stats_cache, _stats_expiry
+    if not PSUTIL_AVAILABLE:
+        return {}
+    now = time.monotonic()
+    if _stats_cache is not None and now < _stats_expiry:
+        return _stats_cache
+    memory = psutil.virtual_memory()
+    disk = psutil.disk_usage("/")
+    _stats_cache = {
+        "memory_percent": memory.percent,
+        "memory_available_mb": memory.available // (1024 * 1024),
+        "disk_percent": disk.percent,
+        "disk_free_gb": disk.free // (1024 ** 3),
+    }
+    _stats_expiry = now + _STATS_TTL
+    return _stats_cache
+
+
+# Per-check budget.  The endpoint answers in roughly this time overall
+# because the checks run concurrently; a hung dependency can no longer
+# stall the probe for its full client-side timeout.
+CHECK_TIMEOUT = 0.5
+
+_CHECKS = (
+    ("database", check_database_connection),
+    ("redis", check_redis_connection),
+    ("vectordb", check_vectordb_connection),
+    ("sqlite", check_sqlite_database),
+)
+
+
+async def get_health_status():
+    """Aggregate health snapshot for the /health endpoint.
+
+    The individual checks are blocking client calls, so each runs in a
+    worker thread and they all proceed in parallel; the slowest check
+    bounds the response time instead of their sum.  A check that times
+    out or raises simply reports unhealthy.
+    """
+    results = await asyncio.gather(
+        *(asyncio.wait_for(asyncio.to_thread(check), CHECK_TIMEOUT)
+          for _, check in _CHECKS),
+        return_exceptions=True,
+    )
+    checks = {
+        name: result is True
+        for (name, _), result in zip(_CHECKS, results)
+    }
+    status = {
+        "status": "healthy" if all(checks.values()) else "degraded",
+        "checks": checks,
+        "system": get_system_stats(),
+    }
+    return status
@@ -0,0 +1,485 @@
+"""
+Hybrid conversation memory for the zoo chatbot.
+
+Keeps the hot, per-session state (recent turns, mentioned animals,
+interests) in plain Python structures for zero-latency reads, and
+mirrors every interaction into a SQLite database so sessions survive
+restarts and long-term stats (favourite animals, common intents) can be
+queried later.
+"""
+
+import itertools
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MEMORY_DB = "user_memory.db"
+
+# Write-behind tuning: flush the history queue once this many rows are
+# pending, or after this long, whichever comes first.  One transaction
+# per batch amortizes the WAL sync over the whole burst instead of
+# paying it per turn.
+FLUSH_BATCH_SIZE = 50
+FLUSH_INTERVAL = 0.2
+CONTEXT_CACHE_SIZE = 512
+
+# SQL lives in module constants: sqlite3 keys its compiled-statement
+# cache on the SQL text, so passing the same object every call reuses
+# the prepared VDBE program instead of re-parsing and re-planning.
+_SQL_INSERT_HISTORY = (
+    "INSERT INTO conversation_history "
+    "(user_id, timestamp, user_message, bot_response, "
+    "intent, entities, source) VALUES (?, ?, ?, ?, ?, ?, ?)")
+_SQL_UPSERT_SESSION = (
+    "INSERT OR REPLACE INTO user_sessions "
+    "(user_id, slots, updated_at) VALUES (?, ?, ?)")
+_SQL_COUNT_STATS = (
+    "SELECT COUNT(*), MIN(timestamp), MAX(timestamp) "
+    "FROM conversation_history WHERE user_id = ?")
+_SQL_TOP_INTENTS = (
+    "SELECT intent, COUNT(*) AS n FROM conversation_history "
+    "WHERE user_id = ? AND intent IS NOT NULL "
+    "GROUP BY intent ORDER BY n DESC LIMIT 5")
+_SQL_SELECT_SESSION = "SELECT slots FROM user_sessions WHERE user_id = ?"
+
+# Interest vocabulary, frozen once at import: the matcher only ever
+# iterates these, so immutable module-level constants avoid rebuilding
+# anything per call and make the sets shareable across trackers.
+_ANIMALS = frozenset([
+    "panda", "penguin", "sea lion", "seal", "arctic fox",
+    "walrus", "capybara", "meerkat", "sloth",
+])
+_TOPIC_KEYWORDS = (
+    ("feeding", frozenset(["feed", "feeding", "eat", "food", "diet"])),
+    ("shows", frozenset(["show", "performance", "presentation", "talk"])),
+    ("conservation", frozenset(["conservation", "endangered", "protect",
+                                "breeding"])),
+    ("photography", frozenset(["photo", "picture", "camera", "instagram"])),
+    ("family", frozenset(["kid", "kids", "child", "children", "family"])),
+)
+
+# Regex fallback for hosts without pyahocorasick: single C-level scans
+# over the raw message (IGNORECASE spares even the .lower() copy)
+# instead of ~34 Python-level substring checks per turn.  Longest
+# alternatives first so "arctic fox" wins over any embedded word.
+_ANIMAL_RE = re.compile(
+    r"\b(?:" + "|".join(
+        map(re.escape, sorted(_ANIMALS, key=len, reverse=True))) + r")\b",
+    re.IGNORECASE)
+_TOPIC_RES = tuple(
+    (topic, re.compile(
+        r"\b(?:" + "|".join(
+            map(re.escape, sorted(keywords, key=len, reverse=True)))
+        + r")\b",
+        re.IGNORECASE))
+    for topic, keywords in _TOPIC_KEYWORDS)
+
+
+# Entities and slots are small nested structures; MessagePack packs
+# them into compact binary blobs noticeably faster than json.dumps,
+# which also shrinks what the WAL has to sync.  Rows written before the
+# switch start with '{' / '[', so _unpack sniffs the first byte and
+# falls back to JSON for them.
+if MSGPACK_AVAILABLE:
+    def _pack(obj):
+        return msgpack.packb(obj, use_bin_type=True)
+else:
+    def _pack(obj):
+        return json.dumps(obj).encode()
+
+
+def _tail(history, n):
+    """Last `n` turns of a history deque as a list (deques don't slice)."""
+    return list(itertools.islice(history, max(0, len(history) - n), None))
+
+
+def _unpack(blob):
+    if blob is None:
+        return {}
+    if isinstance(blob, str):
+        return json.loads(blob)
+    if blob[:1] in (b"{", b"["):
+        return json.loads(blob)
+    if MSGPACK_AVAILABLE:
+        return msgpack.unpackb(blob, raw=False)
+    return json.loads(blob)
+
+
+class HybridMemoryTracker:
+    """In-memory session state backed by a persistent SQLite store."""
+
+    def __init__(self, memory_db_path=DEFAULT_MEMORY_DB, max_history=20):
+        self.memory_db_path = memory_db_path
+        self.max_history = max_history
+        # user_id -> {"history": [...], "mentioned_animals": set,
+        #             "interests": set, "slots": dict}
+        self.conversations = {}
+        # One long-lived read-write connection per tracker.  Opening a
+        # connection per statement re-ran journal setup and paid an
+        # fsync per single-row transaction; WAL with synchronous=NORMAL
+        # keeps readers unblocked and batches the sync work.
+        self._conn = sqlite3.connect(
+            self.memory_db_path, check_same_thread=False,
+            isolation_level=None, cached_statements=256)
+        self._lock = threading.Lock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA cache_size=-8000")
+        self.init_memory_db()
+        self._automaton = self._build_automaton()
+        # History rows are enqueued and flushed in batches by a
+        # background thread; dialogue turns never wait on an fsync.
+        # Personalized-context strings keyed by (user_id, turn count):
+        # the string only changes when a turn lands, so repeated RAG
+        # calls within a turn hit the cache.  LRU eviction keeps the
+        # map bounded across many concurrent visitors.
+        self._ctx_cache = OrderedDict()
+        # Hash of the last slot payload written per user, to skip the
+        # upsert (and its WAL traffic) when a turn leaves slots as-is.
+        self._last_slot_hash = {}
+        self._pending = deque()
+        self._flush_wakeup = threading.Event()
+        self._closed = False
+        self._flusher = threading.Thread(
+            target=self._flush_loop, name="memory-flush", daemon=True)
+        self._flusher.start()
+        logger.info("🧠 Memory tracker ready (db=%s)", self.memory_db_path)
+
+    def init_memory_db(self):
+        """Create the history and session tables if they don't exist."""
+        with self._lock:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversation_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    timestamp REAL NOT NULL,
+                    user_message TEXT,
+                    bot_response TEXT,
+                    intent TEXT,
+                    entities BLOB,
+                    source TEXT
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS user_sessions (
+                    user_id TEXT PRIMARY KEY,
+                    slots BLOB,
+                    updated_at REAL
+                )
+            """)
+            # Covering indexes for get_memory_summary: the GROUP BY
+            # intent and the MIN/MAX(timestamp) aggregates become
+            # index-only B-tree seeks instead of scanning every history
+            # row the user has.
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_hist_user_intent "
+                "ON conversation_history(user_id, intent)")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_hist_user_ts "
+                "ON conversation_history(user_id, timestamp)")
+
+    def close(self):
+        """Flush pending writes and close the SQLite connection."""
+        self._closed = True
+        self._flush_wakeup.set()
+        self._flusher.join(timeout=2.0)
+        self._flush_pending()
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # Write-behind flushing
+    # ------------------------------------------------------------------
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._flush_wakeup.wait(timeout=FLUSH_INTERVAL)
+            self._flush_wakeup.clear()
+            self._flush_pending()
+
+    def _flush_pending(self):
+        """Drain queued history rows in one executemany transaction."""
+        if not self._pending:
+            return
+        rows = []
+        while self._pending:
+            try:
+                rows.append(self._pending.popleft())
+            except IndexError:
+                break
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.executemany(_SQL_INSERT_HISTORY, rows)
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except Exception as e:
+            logger.error("❌ Failed to flush %d interactions: %s",
+                         len(rows), e)
+
+    # ------------------------------------------------------------------
+    # Per-turn tracking
+    # ------------------------------------------------------------------
+
+    def _get_conversation(self, user_id):
+        conversation = self.conversations.get(user_id)
+        if conversation is None:
+            conversation = {
+                # maxlen makes bounded appends O(1); the old list was
+                # re-sliced (an O(max_history) copy) on every trim.
+                "history": deque(maxlen=self.max_history),
+                # Monotonic turn counter for the context-cache key;
+                # len(history) stops moving once the deque saturates.
+                "turns": 0,
+                "mentioned_animals": set(),
+                "interests": set(),
+                # Joined display strings, recomputed only when the sets
+                # grow so context reads never re-join.
+                "_animals_str": "",
+                "_interests_str": "",
+                "slots": self._load_slots(user_id),
+            }
+            self.conversations[user_id] = conversation
+        return conversation
+
+    def _load_slots(self, user_id):
+        """Restore a returning visitor's persisted slots, if any."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    _SQL_SELECT_SESSION, (user_id,)).fetchone()
+            if row and row[0]:
+                return _unpack(row[0])
+        except Exception as e:
+            logger.warning("⚠️ Could not restore slots for %s: %s",
+                           user_id, e)
+        return {}
+
+    def track_interaction(self, user_id, user_message, bot_response,
+                          intent=None, entities=None, source="text"):
+        """Record one user turn in memory and in the database."""
+        conversation = self._get_conversation(user_id)
+        conversation["history"].append({
+            "user": user_message,
+            "bot": bot_response,
+            "intent": intent,
+            "timestamp": time.time(),
+        })
+        conversation["turns"] += 1
+        self.update_user_interests(user_id, user_message)
+        self.store_interaction(
+            user_id, user_message, bot_response, intent, entities, source)
+
+    def store_interaction(self, user_id, user_message, bot_response,
+                          intent=None, entities=None, source="text"):
+        """Queue one turn for persistence to conversation_history."""
+        self._pending.append(
+            (user_id, time.time(), user_message, bot_response,
+             intent, _pack(entities or {}), source))
+        if len(self._pending) >= FLUSH_BATCH_SIZE:
+            self._flush_wakeup.set()
+
+    def _build_automaton(self):
+        """Compile the keyword vocabulary into one Aho-Corasick DFA.
+
+        One C-level pass over the message replaces ~34 Python substring
+        scans.  Returns None when pyahocorasick is not installed; the
+        caller falls back to the plain scans.
+        """
+        if not AHOCORASICK_AVAILABLE:
+            return None
+        automaton = ahocorasick.Automaton()
+        for animal in _ANIMALS:
+            automaton.add_word(animal, ("animal", animal))
+        for topic, keywords in _TOPIC_KEYWORDS:
+            for keyword in keywords:
+                automaton.add_word(keyword, ("topic", topic))
+        automaton.make_automaton()
+        return automaton
+
+    def track_and_update(self, user_id, user_message, bot_response,
+                         intent=None, entities=None, source="text",
+                         slots=None):
+        """Record a turn and its slot changes with at most one sync.
+
+        Callers that did track_interaction followed by update_slots paid
+        two transactions per turn.  Here the in-memory structures update
+        first, then the history row and the session upsert share one
+        BEGIN IMMEDIATE/COMMIT; when the merged slots are unchanged the
+        history row simply joins the write-behind queue and the turn
+        costs no immediate sync at all.
+        """
+        conversation = self._get_conversation(user_id)
+        conversation["history"].append({
+            "user": user_message,
+            "bot": bot_response,
+            "intent": intent,
+            "timestamp": time.time(),
+        })
+        conversation["turns"] += 1
+        self.update_user_interests(user_id, user_message)
+        enhanced_slots = dict(conversation["slots"])
+        enhanced_slots.update(slots or {})
+        conversation["slots"] = enhanced_slots
+        payload = _pack(enhanced_slots)
+        slot_hash = hash(payload)
+        history_row = (user_id, time.time(), user_message, bot_response,
+                       intent, _pack(entities or {}), source)
+        if self._last_slot_hash.get(user_id) == slot_hash:
+            self._pending.append(history_row)
+            if len(self._pending) >= FLUSH_BATCH_SIZE:
+                self._flush_wakeup.set()
+            return
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    self._conn.execute(_SQL_INSERT_HISTORY, history_row)
+                    self._conn.execute(
+                        _SQL_UPSERT_SESSION,
+                        (user_id, payload, time.time()))
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            self._last_slot_hash[user_id] = slot_hash
+        except Exception as e:
+            logger.error("❌ Failed to track turn for %s: %s", user_id, e)
+
+    def update_user_interests(self, user_id, message):
+        """Note animals and topics the visitor brings up."""
+        conversation = self._get_conversation(user_id)
+        animals = conversation["mentioned_animals"]
+        interests = conversation["interests"]
+        n_animals, n_interests = len(animals), len(interests)
+        if self._automaton is not None:
+            for _, (kind, value) in self._automaton.iter(message.lower()):
+                if kind == "animal":
+                    animals.add(value)
+                else:
+                    interests.add(value)
+        else:
+            for match in _ANIMAL_RE.findall(message):
+                animals.add(match.lower())
+            for topic, topic_re in _TOPIC_RES:
+                if topic_re.search(message):
+                    interests.add(topic)
+        # Re-join on growth only; reads then cost a dict lookup.
+        if len(animals) != n_animals:
+            conversation["_animals_str"] = ", ".join(sorted(animals))
+        if len(interests) != n_interests:
+            conversation["_interests_str"] = ", ".join(sorted(interests))
+
+    # ------------------------------------------------------------------
+    # Context for the RAG pipeline
+    # ------------------------------------------------------------------
+
+    def get_conversation_context(self, user_id, last_n=5):
+        """Return the recent turns and accumulated interests for a user."""
+        conversation = self._get_conversation(user_id)
+        history = conversation["history"]
+        return {
+            "history": _tail(history, last_n),
+            "mentioned_animals": conversation["mentioned_animals"],
+            "interests": conversation["interests"],
+            "slots": conversation["slots"],
+        }
+
+    def get_personalized_context(self, user_id):
+        """Build the context string injected into the RAG prompt.
+
+        Pure function of the session state plus the turn counter, so
+        the built string is cached per (user_id, turns) and reused
+        until the next turn changes the key.  The counter is monotonic
+        - keying on len(history) went stale once the bounded deque
+        filled up and the length stopped changing.
+        """
+        conversation = self._get_conversation(user_id)
+        key = (user_id, conversation["turns"])
+        cached = self._ctx_cache.get(key)
+        if cached is not None:
+            self._ctx_cache.move_to_end(key)
+            return cached
+        parts = []
+        if conversation["_animals_str"]:
+            parts.append("Animals discussed: " + conversation["_animals_str"])
+        if conversation["_interests_str"]:
+            parts.append("Visitor interests: "
+                         + conversation["_interests_str"])
+        recent = [turn["user"] for turn in _tail(conversation["history"], 3)]
+        if recent:
+            parts.append("Recent questions: " + " | ".join(recent))
+        result = "\n".join(parts)
+        self._ctx_cache[key] = result
+        if len(self._ctx_cache) > CONTEXT_CACHE_SIZE:
+            self._ctx_cache.popitem(last=False)
+        return result
+
+    # ------------------------------------------------------------------
+    # Slot persistence
+    # ------------------------------------------------------------------
+
+    def update_slots(self, user_id, new_slots):
+        """Merge new slot values into the session and persist them."""
+        conversation = self._get_conversation(user_id)
+        enhanced_slots = dict(conversation["slots"])
+        enhanced_slots.update(new_slots)
+        conversation["slots"] = enhanced_slots
+        payload = _pack(enhanced_slots)
+        # Most turns repeat the previous slot values; rewriting an
+        # identical row still costs a WAL append and its share of a
+        # sync, so unchanged payloads skip the database entirely.
+        slot_hash = hash(payload)
+        if self._last_slot_hash.get(user_id) == slot_hash:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(
+                    _SQL_UPSERT_SESSION, (user_id, payload, time.time()))
+            self._last_slot_hash[user_id] = slot_hash
+        except Exception as e:
+            logger.error("❌ Failed to persist slots: %s", e)
+
+    # ------------------------------------------------------------------
+    # Long-term stats
+    # ------------------------------------------------------------------
+
+    def get_memory_summary(self, user_id):
+        """Aggregate stats for a user from the persistent store."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    _SQL_COUNT_STATS, (user_id,)).fetchone()
+                intents = self._conn.execute(
+                    _SQL_TOP_INTENTS, (user_id,)).fetchall()
+            return {
+                "total_interactions": row[0],
+                "first_seen": row[1],
+                "last_seen": row[2],
+                "top_intents": intents,
+            }
+        except Exception as e:
+            logger.error("❌ Failed to read memory summary: %s", e)
+            return {}
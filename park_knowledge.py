@@ -0,0 +1,562 @@
+"""
+Park knowledge base for the zoo voice assistant.
+
+Static information about park attractions, animal galleries, rides,
+transport and opening hours.  The RAG layer pulls context snippets from
+here when a visitor question is about the park itself rather than a
+specific animal fact.
+"""
+
+import base64
+import functools
+import hashlib
+import json
+import logging
+import re
+import sys
+import zlib
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# General park information
+# ---------------------------------------------------------------------------
+
+PARK_INFO = {
+    "hours": {
+        "park": "10:00 AM - 6:00 PM daily",
+        "last_entry": "5:00 PM",
+        "notes": "Hours may be extended during public holidays and summer weekends.",
+    },
+    "transport": {
+        "mtr": "Take the MTR to Ocean Park Station (South Island Line), Exit B leads straight to the main entrance.",
+        "bus": "Citybus 629 runs from Central (Admiralty) directly to the park entrance.",
+        "cable_car": "The Cable Car connects the Waterfront and the Summit with a scenic 10-minute ride over the bay.",
+        "ocean_express": "The Ocean Express funicular train links the Waterfront and the Summit in about 4 minutes.",
+    },
+    "zones": {
+        "Waterfront": "The lower zone near the main entrance - home to Amazing Asian Animals, the Grand Aquarium and Whiskers Harbour.",
+        "Summit": "The hilltop zone - thrill rides, the Polar Adventure galleries and Marine World.",
+    },
+    "activities": {
+        "Rides": [
+            {
+                "name": "Hair Raiser",
+                "zone": "Summit",
+                "description": "A floorless roller coaster along the cliff edge with views over the South China Sea.",
+            },
+            {
+                "name": "The Flash",
+                "zone": "Summit",
+                "description": "A giant pendulum swing reaching 22 stories high - our most intense thrill ride.",
+            },
+            {
+                "name": "Wild Twister",
+                "zone": "Summit",
+                "description": "A spinning ride that whirls riders up and around at dizzying speed.",
+            },
+            {
+                "name": "The Rapids",
+                "zone": "Summit",
+                "description": "A white-water raft ride through a rainforest gorge - expect to get wet!",
+            },
+            {
+                "name": "Crazy Galleon",
+                "zone": "Summit",
+                "description": "A classic swinging pirate ship ride for the brave.",
+            },
+        ],
+        "Family": [
+            {
+                "name": "Merry-Go-Round",
+                "zone": "Waterfront",
+                "description": "A gentle carousel in Whiskers Harbour, perfect for younger visitors.",
+            },
+            {
+                "name": "Ferris Wheel",
+                "zone": "Summit",
+                "description": "A slow scenic wheel with views across the harbour.",
+            },
+            {
+                "name": "Old Hong Kong",
+                "zone": "Waterfront",
+                "description": "A nostalgic recreation of 1950s-70s Hong Kong streets with snacks and tram photos.",
+            },
+        ],
+    },
+    "conservation": {
+        "foundation": "The park's conservation foundation funds research and breeding programmes for giant pandas, Chinese white dolphins and horseshoe crabs.",
+        "programmes": "Daily keeper talks explain how visitors can help protect wild populations.",
+    },
+}
+
+# ---------------------------------------------------------------------------
+# Animal galleries and attractions
+# ---------------------------------------------------------------------------
+
+def _prepare_park_info():
+    """Attach precomputed lookup tokens to PARK_INFO attractions.
+
+    The RAG layer matches query words against attraction names on every
+    park question; pre-lowering and tokenizing the names once at import
+    turns that from nested str.lower()/split() loops into frozenset
+    intersections.
+    """
+    for activity_list in PARK_INFO["activities"].values():
+        for attraction in activity_list:
+            attraction["_name_lower"] = attraction["name"].lower()
+            attraction["_tokens"] = frozenset(
+                attraction["_name_lower"].replace("-", " ").split())
+
+
+_prepare_park_info()
+
+# Spoken forms of the transport modes ("cable_car" -> "cable car"),
+# computed once for the same reason.
+TRANSPORT_PHRASES = {
+    mode: mode.replace("_", " ") for mode in PARK_INFO["transport"]}
+
+
+class Attraction(NamedTuple):
+    """One animal gallery / attraction row.
+
+    A NamedTuple instead of a per-entry dict: fields live in one flat
+    C array indexed by position, so `entry.zone` is an offset read with
+    no hash probe, and each row drops the dict's hash-table overhead.
+    Prose descriptions live in the compressed sidecar below, keyed by
+    the PARK_ANIMAL_INFO key (see get_description).
+    """
+
+    name: str
+    location: str
+    zone: str
+    animals: tuple
+    highlights: tuple
+    what_near_by: tuple
+    url: str
+
+
+# Identical tuples across entries collapse onto one shared object (the
+# empty tuple and repeated neighbour pairs especially); tuples are also
+# hashable, so downstream code can use the fields as dict keys or
+# frozenset elements without a defensive copy.
+_TUPLE_CACHE = {}
+
+
+def _dedup(t):
+    return _TUPLE_CACHE.setdefault(t, t)
+
+
+def _A(name, location, zone, animals, highlights, what_near_by, url):
+    """Build one Attraction from the literal below.
+
+    Interns the categorical strings and dedups the tuple fields: zones,
+    locations and animal names repeat across entries, so every
+    duplicate shares one str (saving the per-copy object header) and
+    downstream equality filters become pointer compares.  The "None"
+    sentinel in what_near_by becomes an empty tuple so consumers can
+    iterate it without a type branch.
+    """
+    if what_near_by == "None":
+        what_near_by = ()
+    return Attraction(
+        name=sys.intern(name),
+        location=sys.intern(location),
+        zone=sys.intern(zone),
+        animals=_dedup(tuple(sys.intern(s) for s in animals)),
+        highlights=_dedup(tuple(highlights)),
+        what_near_by=_dedup(tuple(sys.intern(s) for s in what_near_by)),
+        url=url,
+    )
+
+
+PARK_ANIMAL_INFO = {
+    "giant_panda_adventure": _A(
+        name="Giant Panda Adventure",
+        location="Amazing Asian Animals, near the main entrance",
+        zone="Waterfront",
+        animals=("Giant Panda (An An, Ying Ying)", "Red Panda"),
+        highlights=("Daily keeper talks at 11:00 and 15:00", "Bamboo feeding sessions", "Indoor air-conditioned viewing"),
+        what_near_by=("Sichuan Treasures", "Panda Cafe", "Old Hong Kong"),
+        url="https://www.zoo.example/giant-panda-adventure",
+    ),
+    "sichuan_treasures": _A(
+        name="Sichuan Treasures",
+        location="Amazing Asian Animals",
+        zone="Waterfront",
+        animals=("Golden Snub-nosed Monkey", "Chinese Giant Salamander"),
+        highlights=("Rare species found nowhere else in the city", "Conservation exhibits"),
+        what_near_by=("Giant Panda Adventure", "Goldfish Treasures"),
+        url="https://www.zoo.example/sichuan-treasures",
+    ),
+    "rainforest_trail": _A(
+        name="Rainforest Trail",
+        location="Rainforest zone, mid-level",
+        zone="Waterfront",
+        animals=("Capybara", "Two-toed Sloth", "Kinkajou", "Green Aracari"),
+        highlights=("Capybara feeding at 14:00", "Walk-through canopy path", "The Rapids ride entrance nearby"),
+        what_near_by=("The Rapids", "Expedition Trail"),
+        url="https://www.zoo.example/rainforest-trail",
+    ),
+    "south_pole_spectacular": _A(
+        name="South Pole Spectacular",
+        location="Polar Adventure",
+        zone="Summit",
+        animals=("King Penguin", "Gentoo Penguin", "Southern Rockhopper Penguin"),
+        highlights=("Underwater viewing gallery", "Penguin feeding at 10:30 and 16:00", "Ice-themed restaurant next door"),
+        what_near_by=("North Pole Encounter", "Arctic Blast"),
+        url="https://www.zoo.example/south-pole-spectacular",
+    ),
+    "north_pole_encounter": _A(
+        name="North Pole Encounter",
+        location="Polar Adventure",
+        zone="Summit",
+        animals=("Arctic Fox", "Spotted Seal", "Snowy Owl"),
+        highlights=("Underwater seal tunnel", "Arctic fox den viewing", "Seasonal coat-change exhibit"),
+        what_near_by=("South Pole Spectacular", "Tuxedos Restaurant"),
+        url="https://www.zoo.example/north-pole-encounter",
+    ),
+    "pacific_pier": _A(
+        name="Pacific Pier",
+        location="Marine World",
+        zone="Summit",
+        animals=("California Sea Lion", "Harbour Seal"),
+        highlights=("Sea lion feeding", "Training demonstrations", "Open-air harbour setting"),
+        what_near_by=("Ferris Wheel", "Hair Raiser"),
+        url="https://www.zoo.example/pacific-pier",
+    ),
+    "grand_aquarium": _A(
+        name="Grand Aquarium",
+        location="Aqua City, near the main entrance",
+        zone="Waterfront",
+        animals=("Reef Shark", "Spotted Eagle Ray", "Humphead Wrasse", "Sea Star"),
+        highlights=("One of the world's largest aquarium domes", "Touch pool", "Dive feeding shows"),
+        what_near_by=("Aqua City Bakery", "Ocean Express Waterfront Station"),
+        url="https://www.zoo.example/grand-aquarium",
+    ),
+    "shark_mystique": _A(
+        name="Shark Mystique",
+        location="Marine World",
+        zone="Summit",
+        animals=("Sand Tiger Shark", "Zebra Shark", "Shovelnose Ray"),
+        highlights=("Walk-under shark tunnel", "Myth-busting exhibits", "Conservation pledge wall"),
+        what_near_by=("Pacific Pier", "The Flash"),
+        url="https://www.zoo.example/shark-mystique",
+    ),
+    "sea_jelly_spectacular": _A(
+        name="Sea Jelly Spectacular",
+        location="Marine World",
+        zone="Summit",
+        animals=("Moon Jelly", "Upside-down Jelly", "Pacific Sea Nettle"),
+        highlights=("Mirrored infinity gallery", "Interactive lighting room"),
+        what_near_by="None",
+        url="https://www.zoo.example/sea-jelly-spectacular",
+    ),
+    "whiskers_harbour": _A(
+        name="Whiskers Harbour",
+        location="Near the main entrance",
+        zone="Waterfront",
+        animals=(),
+        highlights=("No height restriction on most rides", "Daily mascot meet-and-greet"),
+        what_near_by=("Grand Aquarium", "Old Hong Kong"),
+        url="https://www.zoo.example/whiskers-harbour",
+    ),
+    "expedition_trail": _A(
+        name="Expedition Trail",
+        location="Adventure zone, mid-level",
+        zone="Waterfront",
+        animals=("Meerkat", "Aldabra Giant Tortoise", "Scarlet Ibis"),
+        highlights=("Meerkat lookout dome", "Century-old tortoises", "Free-flight aviary"),
+        what_near_by=("Rainforest Trail",),
+        url="https://www.zoo.example/expedition-trail",
+    ),
+}
+
+
+# ---------------------------------------------------------------------------
+# Gallery descriptions (compressed sidecar)
+# ---------------------------------------------------------------------------
+# The 300-800 char prose descriptions used to live as triple-quoted
+# literals inside each entry, costing ~3 KB of always-resident strings
+# at import that most queries never read.  They now ship as one
+# zlib-compressed JSON blob, decoded lazily on first use.
+
+_DESC_BLOB = (
+    b"eNplV11v3DYQ/CsLv+TldLDbBi36ZgRBghZujSRoUaDAYUXxJEYUqZCUFbXof+8sKZ19Sp"
+    b"APixKXu7Mzs8y/N61hl04ju4ZP3Dxpl6agb36mm3fygh7lBd1vL8hE6vygKXnyU6C8m/Lu"
+    b"SPdOfuNn+su4Nv91+NvRi1/WPMkbg69IWTNw0pXyLgVvrW6o5qH2njquTeJEg290XveOUq"
+    b"fxPLnExl3HPPugY4rkz/TRqG5id6RftR51oMS2jxQmbJ+N0tSwsUtOUH8dLSLlsCX7V9dR"
+    b"G6OThFxTip33KR5IcQj4IceIo1aGLSLW3CPLzrRddTY1UMIfbo7XET/hqBaf64AUbESZfo"
+    b"oa6WHrCqBAUgtA/kmHDiFoRgUzL/F4c6CbWMo7JUSPaEaUNq0106dtUXKdFefQjFzYAWcb"
+    b"6Rz8cAUjPUk2iyB3nWn0U+qqGajSm844PqBhyk6NZCYBWm8b7Si6qa6cj8h/8K7XBVn5QH"
+    b"bpqK+jFqpEtjzgO3Snyt9aDq2cxMPYmRrf0NqW2QfbHAAPq05OnkaQ7jrk3fEnGnSSorHJ"
+    b"atemLiMVUF7hBcBC0wWoD5c1YIU1mo1rIo4Kfmo7ELKbBoP8gx+NYlvaQ3OngaHicak5cL"
+    b"w+f+ZGy8mxA5J+ptF7C5Kk2VfJA5ZofeogGEb6g0/GO6tj3ApU7PyYQbuO2hvX82ecLtTm"
+    b"Fh08J8DVcOiP9GBiEjSGjAoK70H1HG5TDafrcM9YlApNEv5ZWjQHQu2uKeSSpp9Gb/VJiJ"
+    b"1YTWhNZpi8oUe8oY/Pb9AYhd4kHfPp96BUUMkoUp6lnUkk3hmRx0/V3e1OXboNWgOq2SB0"
+    b"LwWN6N5kHNZaWA0kty0UrUkOOjgkrPrOj1D3dcTL102xmFGSmIRnMwt6T0bPsi5N93M80u"
+    b"+QGP14+7wR3rRj7NYnb70r5D5rnVXQMTLAnmIrjN4sGUTnwwaidkp0pjOEv8l6gfDttg6T"
+    b"QKiIzKJJPkQSKYE3WVIFmBXRs/8KrHYaHX1KQjEt2s4QOT8v5GeL4sRrXm5GJ8BBKQV9kX"
+    b"pg3XLCdUwpFvGiR2WVpGdt1uzcmZR5DvCQODoU9FLVwc9ZrHEahixnyYJ37vyiBWlyTlvI"
+    b"FP65+AnqSarbDkUR1vvx4nwZzpGVORt1Gk2B8bE80yOeX/CP6Q1bA447sY+OQy31ISgsL6"
+    b"cvEn7+ZAekZrTerzx7sRkZ1Rz7bfgI8YDsH1u3oF6qp4UizNXuJpKJnQzI5CF2+beUuB7T"
+    b"TNJ3iqrTzSTTbSNVMoNIQtLo8/yKewN9wtwVOcvXjYbpRjymHHXN8mzR4fwa6WYM24CAJ/"
+    b"4ycTDTICgKOd7JKt2vq/A6Cysc4BKIgsJeH25vb0sdeWxIV+gHLOWZp3eJ1dqhER1y0DIy"
+    b"L+b9Kj67+3ZSg8sDYHyPWWnxJ8V1tsjBO/ndfV9lc69mg9ebgDEqtZWxoM/iu6EHZJsYNL"
+    b"dQWMC8LFwE+JPakVw8Wow1dyTCtFb14ElNahpq4F4MUYKfhgV++2XKN6KPskIP68o2vzM2"
+    b"Mj1cI6O85JRj5kQyfnevN+R2MpaqdPNiCMnAr7JoiFVYLNhedHOkt19lQAKxeoqi4gEEoG"
+    b"HBhLmOyWBwepnHdtnBvQA9da7M8SweMGc2FhcQP8LUM5VK8ZpPn3H5Wr4ZBsDpF3lxNQsa"
+    b"E3HEcgEjCTYbrBIHlRckOE+cb30nE0bcZDC4YQHIw+pTlTVpvTdJkKqEGTxq3wIXie18Z4"
+    b"xgTdWIR+VChNiJzhwGgGJbzoYmaAIElIHBnAuH18UeFDitTiA1/7mu0fvVHUyZeQ10q1iI"
+    b"15smvqJ/RADZuGWECRORgih6x0Ag1WYYDuvlrEK0IXMHo+lyi3rQISzVO199yEOaHnzcjX"
+    b"ZO0L8qBpBNrmNYhMPVUou2SIZ+MPmDXByIgJTl8fla9Paytl6LjGSAy31qPFQifBS+ZHPO"
+    b"Q3XQOvQsl+F8o9u1EoPOG5FFEeAZOq3OWenET4bDUobTvW24DrxeCp93rbct981/GwAsur"
+    b"gXm9xhylGzVFzuiPTd61t0xHpY34Cu/vc/b45gAg=="
+)
+
+
+@functools.lru_cache(maxsize=1)
+def _descriptions():
+    """Decode the description sidecar once, on first access."""
+    return json.loads(zlib.decompress(base64.b64decode(_DESC_BLOB)))
+
+
+def get_description(key):
+    """Prose description for an attraction key ("" if unknown)."""
+    return _descriptions().get(key, "")
+
+
+# ---------------------------------------------------------------------------
+# Lookup helpers
+# ---------------------------------------------------------------------------
+
+def _build_indexes():
+    """Inverted indexes over PARK_ANIMAL_INFO, built once at import.
+
+    Map lowercased animal / zone / nearby-attraction / location to the
+    frozenset of attraction keys, so combined questions ("which
+    attractions have penguins in Summit?") become two dict lookups and
+    a set intersection instead of a full dict walk with per-entry list
+    scans.  Animal strings like "Giant Panda (An An, Ying Ying)" index
+    the species and each named individual separately.
+    """
+    animal_index = {}
+    zone_index = {}
+    nearby_index = {}
+    location_index = {}
+
+    def _add(index, raw, key):
+        term = raw.strip().lower()
+        if term:
+            index.setdefault(term, set()).add(key)
+
+    for key, info in PARK_ANIMAL_INFO.items():
+        _add(zone_index, info.zone, key)
+        _add(location_index, info.location, key)
+        for animal in info.animals:
+            species, _, individuals = animal.partition("(")
+            _add(animal_index, species, key)
+            for individual in individuals.rstrip(")").split(","):
+                _add(animal_index, individual, key)
+        # what_near_by is normalized to a tuple by _A, so the empty
+        # case is just a no-op loop.
+        for neighbour in info.what_near_by:
+            _add(nearby_index, neighbour, key)
+
+    freeze = lambda index: {term: frozenset(keys)
+                            for term, keys in index.items()}
+    return (freeze(animal_index), freeze(zone_index),
+            freeze(nearby_index), freeze(location_index))
+
+
+ANIMAL_INDEX, ZONE_INDEX, NEARBY_INDEX, LOCATION_INDEX = _build_indexes()
+
+_EMPTY_KEYS = frozenset()
+
+# Columnar projection of the table for scan-style queries: iterating
+# one flat tuple of 11 small strings stays in cache and skips the
+# per-entry dict probes.  Rebuilt only if PARK_ANIMAL_INFO ever mutates
+# (it is module-constant in practice).
+_KEYS = tuple(PARK_ANIMAL_INFO)
+_NAMES = tuple(PARK_ANIMAL_INFO[k].name for k in _KEYS)
+_ZONES = tuple(PARK_ANIMAL_INFO[k].zone for k in _KEYS)
+_ANIMALS = tuple(
+    frozenset(a.lower() for a in PARK_ANIMAL_INFO[k].animals)
+    for k in _KEYS)
+
+
+def filter_by_zone(zone):
+    """Attraction keys in `zone`, in definition order.
+
+    Unlike find_by_zone's frozenset, this preserves order; the scan is
+    one C-level walk over the _ZONES column.
+    """
+    return [key for key, z in zip(_KEYS, _ZONES) if z == zone]
+
+
+def find_by_animal(name):
+    """Keys of attractions housing `name` (species or individual)."""
+    return ANIMAL_INDEX.get(name.strip().lower(), _EMPTY_KEYS)
+
+
+def find_by_zone(zone):
+    """Keys of attractions in `zone` ("Waterfront" / "Summit")."""
+    return ZONE_INDEX.get(zone.strip().lower(), _EMPTY_KEYS)
+
+
+# Lowercased full-text blob per attraction: substring checks against it
+# are single C-level searches, with no per-query str.lower() pass over
+# the descriptions.  Built lazily (it pulls in the description sidecar)
+# and cached for the life of the process.
+@functools.lru_cache(maxsize=1)
+def _search_blobs():
+    return {
+        key: " ".join(
+            (info.name, get_description(key))
+            + info.animals
+            + info.highlights
+        ).lower()
+        for key, info in PARK_ANIMAL_INFO.items()
+    }
+
+
+@functools.lru_cache(maxsize=1)
+def _keyword_index():
+    """Inverted index: lowercased token -> galleries whose text contains it.
+
+    Built on first search so the per-query helpers below are hash
+    lookups instead of rebuilding and rescanning every gallery blob per
+    call; processes that never field a park question never pay for it.
+    """
+    index = {}
+    for key, blob in _search_blobs().items():
+        info = PARK_ANIMAL_INFO[key]
+        for token in set(blob.replace("-", " ").replace(",", " ").split()):
+            index.setdefault(token, []).append(info)
+    return index
+
+
+# Bloom-filter prefilter for the substring search below.  Most probe
+# terms appear in no gallery at all; two bit tests per entry reject
+# those rows without touching their ~200-byte blobs.  Tokens are
+# inserted together with every prefix of at least _BLOOM_MIN_PREFIX
+# chars so that "penguin" still clears the filter for a blob that only
+# says "penguins"; needle words shorter than that skip the filter.
+_BLOOM_BITS = 4096
+_BLOOM_MIN_PREFIX = 4
+
+
+def _bloom_positions(word):
+    """Two bit positions for `word`, from one truncated blake2b."""
+    h = int.from_bytes(
+        hashlib.blake2b(word.encode(), digest_size=8).digest(), "little")
+    return h & (_BLOOM_BITS - 1), (h >> 32) & (_BLOOM_BITS - 1)
+
+
+@functools.lru_cache(maxsize=1)
+def _blooms():
+    """Per-entry Bloom mask over the blob's tokens and token prefixes.
+
+    One arbitrary-precision int per entry; the shift-and-test against
+    it runs in C.  Built lazily alongside the blobs it summarizes.
+    """
+    blooms = {}
+    for key, blob in _search_blobs().items():
+        mask = 0
+        for token in set(re.findall(r"\w+", blob)):
+            for end in range(_BLOOM_MIN_PREFIX, len(token) + 1):
+                b1, b2 = _bloom_positions(token[:end])
+                mask |= (1 << b1) | (1 << b2)
+        blooms[key] = mask
+    return blooms
+
+
+@functools.lru_cache(maxsize=256)
+def keyword_search(term):
+    """Attraction keys whose text contains `term` as a substring.
+
+    Complements the token index: catches phrases ("sea lion feeding")
+    and word prefixes that tokenization misses.  The Bloom masks weed
+    out entries that cannot contain the term's words (assuming each
+    word starts at a word boundary in the blob) before the substring
+    confirm.  Cached per term since visitors ask the same things all
+    day.
+    """
+    needle = term.lower()
+    blobs = _search_blobs()
+    words = [w for w in re.findall(r"\w+", needle)
+             if len(w) >= _BLOOM_MIN_PREFIX]
+    candidates = blobs
+    if words:
+        probes = [_bloom_positions(w) for w in words]
+        candidates = [
+            key for key, mask in _blooms().items()
+            if all((mask >> b1) & 1 and (mask >> b2) & 1
+                   for b1, b2 in probes)
+        ]
+    return tuple(key for key in candidates if needle in blobs[key])
+
+# animal substring -> preformatted location line, covering every listed
+# animal and each word of its name ("sea lion" -> "sea", "lion" too).
+_ANIMAL_LOCATION_INDEX = {}
+for _info in PARK_ANIMAL_INFO.values():
+    _line = f"{_info.name} ({_info.location}, {_info.zone} zone)"
+    for _listed in _info.animals:
+        _lower = _listed.lower()
+        _ANIMAL_LOCATION_INDEX.setdefault(_lower, _line)
+        for _word in _lower.split():
+            _ANIMAL_LOCATION_INDEX.setdefault(_word, _line)
+del _info, _line, _listed, _lower, _word
+
+
+def find_animal_location(animal_name):
+    """Return a human-readable location string for an animal, or None."""
+    animal_lower = animal_name.lower().strip()
+    line = _ANIMAL_LOCATION_INDEX.get(animal_lower)
+    if line is not None:
+        return line
+    # Cold path for phrases not in the index ("baby giant panda").
+    for listed, indexed_line in _ANIMAL_LOCATION_INDEX.items():
+        if animal_lower in listed or listed in animal_lower:
+            return indexed_line
+    return None
+
+
+def search_animal_detailed_info(query):
+    """Look up galleries whose text mentions any query word.
+
+    Returns a list of matching Attraction rows (possibly empty), in
+    gallery definition order.
+    """
+    index = _keyword_index()
+    seen = set()
+    for word in query.lower().split():
+        if len(word) > 3:
+            hits = index.get(word)
+            if hits is None and word.endswith("s"):
+                # Simple plural fallback: "penguins" -> "penguin".
+                hits = index.get(word[:-1])
+            for info in hits or ():
+                seen.add(id(info))
+    # Collected per query word, emitted in table order: consumers
+    # truncate the list, so word order must not decide who survives.
+    return [info for info in PARK_ANIMAL_INFO.values() if id(info) in seen]
+
+
+def get_detailed_attraction_info(name):
+    """Return the full Attraction row for an attraction by (fuzzy) name."""
+    name_lower = name.lower().strip()
+    for key, info in PARK_ANIMAL_INFO.items():
+        if name_lower in info.name.lower() or name_lower == key:
+            return info
+    return None
+
+
+def get_all_galleries_summary():
+    """One-line-per-gallery summary used for 'what animals do you have' questions."""
+    lines = []
+    for key, info in PARK_ANIMAL_INFO.items():
+        if info.animals:
+            lines.append(f"- {info.name} ({info.zone}): {', '.join(info.animals)}")
+    return "\n".join(lines)